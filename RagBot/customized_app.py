@@ -7,20 +7,12 @@ import yaml
 from streamlit_lottie import st_lottie
 from descope.descope_client import DescopeClient
 from descope.exceptions import AuthException
-import time
-from pymongo import MongoClient
 
 # --- Page config ---
 st.set_page_config(page_title="RagBot - AI Assistant", page_icon="🤖", layout="centered")
 warnings.filterwarnings("ignore")
 logging.getLogger("transformers").setLevel(logging.ERROR)
 
-# --- MONGODB SETUP ---
-mongo_uri = st.secrets["MONGO_URI"]
-mongo_client = MongoClient(mongo_uri)
-db = mongo_client.ragbot
-chat_collection = db.chat_history
-
 # --- Global Style ---
 st.markdown("""
 
@@ -225,11 +217,19 @@ if ("authentication_status" not in st.session_state or not st.session_state["aut
         st.stop() 
 
 # --- MAIN APP ---
-from modules.chat import display_chat_history, handle_user_input, download_chat_history
+from modules.chat import display_chat_history, handle_user_input, flush_chat_writes
+from modules.export import download_chat_history, show_chat_export
 from modules.pdf_handler import upload_pdfs
-from modules.vectorstore import load_vectorstore
+from modules.jobs import submit_ingest_job, user_jobs, show_ingest_job, show_ingest_result, start_ingest_workers
+from modules.store_manager import user_store, attach_user_store
 from modules.llm import get_llm_chain
 from modules.chroma_inspector import inspect_chroma
+from modules.embeddings import warm_embeddings
+
+# Load the shared embedding model in the background so the first upload doesn't pay for it
+warm_embeddings()
+# Background ingestion workers (resumes uploads queued before a restart)
+start_ingest_workers()
 
 # --- SIDEBAR: User Card and Controls ---
 with st.sidebar:
@@ -255,7 +255,9 @@ with st.sidebar:
         )
         st.header("📥 Upload & Inspect PDFs")
         if st.button("Logout"):
-            for key in ["token", "refresh_token", "user", "name"]:
+            # Session over: make sure its last messages reach MongoDB
+            flush_chat_writes(timeout=5)
+            for key in ["token", "refresh_token", "user", "name", "vectorstore", "history_summary", "ingest_job", "messages", "history_cursor", "chat_window", "chat_export", "chat_export_data"]:
                 st.session_state.pop(key, None)
             st.session_state["authentication_status"] = False
             st.rerun()
@@ -300,21 +302,28 @@ st.divider()
 
 st.write(f"Hello, **{st.session_state.get('name', 'User')}**! Let's work with your documents.")
 
+user_id = st.session_state.get("user", {}).get("email", "default_user")
+
+# Returning users can chat with their persisted documents straight away
+if "vectorstore" not in st.session_state:
+    existing_store = attach_user_store(user_id)
+    if existing_store is not None:
+        st.session_state.vectorstore = existing_store
+
 uploaded_files, submitted = upload_pdfs()
 
-# --- Progress Bar for PDF Processing ---
+# --- Background ingestion: queue the upload and poll its progress ---
 if submitted and uploaded_files:
-    progress_text = "Crunching your documents…"
-    my_bar = st.progress(0, text=progress_text)
-    for percent_complete in range(100):
-        time.sleep(0.01)
-        my_bar.progress(percent_complete + 1, text=progress_text)
-    with st.spinner("Finalizing..."):
-        user_id = st.session_state.get("user", {}).get("email", "default_user")
-        vectorstore = load_vectorstore(uploaded_files, user_id)
-        st.session_state.vectorstore = vectorstore
-    my_bar.empty()
-    st.success("Vector database updated! 🎉")
+    st.session_state.ingest_job = submit_ingest_job(user_id, uploaded_files)
+
+# Pick up an upload still running from an earlier session or before a restart
+if "ingest_job" not in st.session_state:
+    active_jobs = user_jobs(user_id)
+    if active_jobs:
+        st.session_state.ingest_job = active_jobs[-1]["id"]
+
+show_ingest_job(user_id)
+show_ingest_result()
 
 # --- Chat Section ---
 st.markdown("### 💬 Chat with your Documents")
@@ -338,7 +347,10 @@ display_chat_history()
 
 # Only allow response if vectorstore exists
 if "vectorstore" in st.session_state:
-    handle_user_input(get_llm_chain(st.session_state.vectorstore))
+    # Re-fetched each run in case the idle handle was closed, and held for the whole turn (streaming included)
+    with user_store(user_id) as vectorstore:
+        st.session_state.vectorstore = vectorstore
+        handle_user_input(get_llm_chain(vectorstore, user_id=user_id))
 else:
     st.info("📁 Upload a PDF to start chatting with your documents.")
 
@@ -375,3 +387,6 @@ if st.button("📥 Download Chat History", key="download-chat-btn"):
     """, unsafe_allow_html=True)
     if st.button("📥 Download Chat History", key="download-chat-btn"):
         download_chat_history()
+
+# Export options, progress and the finished file's download button (after the button, so a new export shows at once)
+show_chat_export()
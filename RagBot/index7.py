@@ -7,7 +7,6 @@ import yaml
 from streamlit_lottie import st_lottie
 from descope.descope_client import DescopeClient
 from descope.exceptions import AuthException
-import time
 
 # --- Page config ---
 st.set_page_config(page_title="RagBot - AI Assistant", page_icon="🤖", layout="centered")
@@ -176,11 +175,18 @@ if ("authentication_status" not in st.session_state or not st.session_state["aut
         st.stop() 
 
 # --- MAIN APP ---
-from modules.chat import display_chat_history, handle_user_input, download_chat_history
+from modules.chat import display_chat_history, handle_user_input, flush_chat_writes
+from modules.export import download_chat_history, show_chat_export
 from modules.pdf_handler import upload_pdfs
 from modules.vectorstore import load_vectorstore
+from modules.store_manager import user_store
+from modules.ingest import describe_progress, describe_timings
 from modules.llm import get_llm_chain
 from modules.chroma_inspector import inspect_chroma
+from modules.embeddings import warm_embeddings
+
+# Load the shared embedding model in the background so the first upload doesn't pay for it
+warm_embeddings()
 
 # --- SIDEBAR: User Card and Controls ---
 with st.sidebar:
@@ -206,6 +212,8 @@ with st.sidebar:
         )
         st.header("📥 Upload & Inspect PDFs")
         if st.button("Logout"):
+            # Session over: make sure its last messages reach MongoDB
+            flush_chat_writes(timeout=5)
             for key in ["token", "refresh_token", "user", "name"]:
                 st.session_state.pop(key, None)
             st.session_state["authentication_status"] = False
@@ -257,14 +265,21 @@ uploaded_files, submitted = upload_pdfs()
 if submitted and uploaded_files:
     progress_text = "Crunching your documents…"
     my_bar = st.progress(0, text=progress_text)
-    for percent_complete in range(100):
-        time.sleep(0.01)
-        my_bar.progress(percent_complete + 1, text=progress_text)
-    with st.spinner("Finalizing..."):
-        vectorstore = load_vectorstore(uploaded_files)
-        st.session_state.vectorstore = vectorstore
+
+    last_metrics = {}
+
+    # Driven by the real pipeline: pages parsed, chunks embedded, vectors written
+    def show_progress(metrics):
+        last_metrics.update(metrics)
+        my_bar.progress(metrics["fraction"], text=f"{progress_text} {describe_progress(metrics)}")
+
+    user_id = st.session_state.get("user", {}).get("email", "default_user")
+    vectorstore = load_vectorstore(uploaded_files, user_id, progress=show_progress)
+    st.session_state.vectorstore = vectorstore
     my_bar.empty()
     st.success("Vector database updated! 🎉")
+    if last_metrics.get("chunks"):
+        st.caption(describe_timings(last_metrics))
 
 # --- Chat Section ---
 if "vectorstore" in st.session_state:
@@ -283,9 +298,12 @@ if "vectorstore" in st.session_state:
         """,
         unsafe_allow_html=True
     )
-    inspect_chroma(st.session_state.vectorstore)
-    display_chat_history()
-    handle_user_input(get_llm_chain(st.session_state.vectorstore))
+    # Re-fetched each run in case the idle handle was closed, and held for the whole turn (streaming included)
+    with user_store(st.session_state.get("user", {}).get("email", "default_user")) as vectorstore:
+        st.session_state.vectorstore = vectorstore
+        inspect_chroma(vectorstore)
+        display_chat_history()
+        handle_user_input(get_llm_chain(vectorstore))
     st.markdown("</div>", unsafe_allow_html=True)
 
     # Floating Action Button for Download
@@ -294,3 +312,4 @@ if "vectorstore" in st.session_state:
     """, unsafe_allow_html=True)
     if st.button("📥 Download Chat History", key="download-chat-btn"):
         download_chat_history()
+    show_chat_export()
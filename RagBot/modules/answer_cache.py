@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from modules.condense import is_standalone
+from modules.embeddings import get_embeddings
+
+# Cosine similarity above which two questions count as the same question
+SIMILARITY_THRESHOLD = float(os.environ.get("RAGBOT_ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_TTL_SECONDS = int(os.environ.get("RAGBOT_ANSWER_CACHE_TTL", 24 * 60 * 60))
+MAX_ANSWERS_PER_USER = 256
+MAX_CACHED_USERS = 1024
+
+_entries = OrderedDict()  # user_id -> OrderedDict(entry_id -> entry), both in LRU order
+_corpus_versions = defaultdict(int)
+_next_id = 0
+_lock = threading.Lock()
+
+
+# === Bumped whenever a user's documents change; cached answers from older versions stop matching ===
+def corpus_version(user_id):
+    return _corpus_versions[user_id]
+
+
+def invalidate_answers(user_id):
+    with _lock:
+        _corpus_versions[user_id] += 1
+        _entries.pop(user_id, None)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def lookup_answer(user_id, query_vector, settings):
+    now = time.time()
+    version = corpus_version(user_id)
+    with _lock:
+        user_entries = _entries.get(user_id)
+        if not user_entries:
+            return None
+        best, best_score = None, SIMILARITY_THRESHOLD
+        for entry_id, entry in list(user_entries.items()):
+            if now - entry["created"] > ANSWER_TTL_SECONDS:
+                del user_entries[entry_id]
+                continue
+            if entry["version"] != version or entry["settings"] != settings:
+                continue
+            score = float(np.dot(entry["vector"], query_vector))
+            if score >= best_score:
+                best, best_score = entry_id, score
+        if best is None:
+            return None
+        user_entries.move_to_end(best)
+        _entries.move_to_end(user_id)
+        return user_entries[best]
+
+
+def store_answer(user_id, query_vector, settings, answer, context, version):
+    global _next_id
+    with _lock:
+        # The corpus changed while this answer was being generated
+        if version != _corpus_versions[user_id]:
+            return
+        user_entries = _entries.setdefault(user_id, OrderedDict())
+        _entries.move_to_end(user_id)
+        _next_id += 1
+        user_entries[_next_id] = {
+            "vector": query_vector,
+            "version": version,
+            "settings": settings,
+            "answer": answer,
+            "context": context,
+            "created": time.time(),
+        }
+        while len(user_entries) > MAX_ANSWERS_PER_USER:
+            user_entries.popitem(last=False)
+        while len(_entries) > MAX_CACHED_USERS:
+            _entries.popitem(last=False)
+
+
+# === Chain wrapper answering repeated standalone questions from the cache ===
+class AnswerCachingChain:
+    def __init__(self, chain, user_id, settings):
+        self.chain = chain
+        self.user_id = user_id
+        self.settings = settings
+
+    def _query_vector(self, inputs):
+        # Follow-ups depend on the conversation, so only self-contained questions are cached
+        if inputs.get("chat_history") and not is_standalone(inputs["input"]):
+            return None
+        # Same text the retriever embeds, so the vector is reused from the query cache there
+        return _unit(get_embeddings().embed_query(inputs["input"]))
+
+    def invoke(self, inputs, config=None):
+        vector = self._query_vector(inputs)
+        if vector is not None:
+            hit = lookup_answer(self.user_id, vector, self.settings)
+            if hit:
+                return {**inputs, "context": hit["context"], "answer": hit["answer"]}
+
+        version = corpus_version(self.user_id)
+        result = self.chain.invoke(inputs, config)
+        if vector is not None:
+            store_answer(self.user_id, vector, self.settings, result["answer"], result.get("context", []), version)
+        return result
+
+    def stream(self, inputs, config=None):
+        vector = self._query_vector(inputs)
+        if vector is not None:
+            hit = lookup_answer(self.user_id, vector, self.settings)
+            if hit:
+                yield {"context": hit["context"]}
+                yield {"answer": hit["answer"]}
+                return
+
+        version = corpus_version(self.user_id)
+        answer, context = [], []
+        for chunk in self.chain.stream(inputs, config):
+            if "context" in chunk:
+                context.extend(chunk["context"])
+            if "answer" in chunk:
+                answer.append(chunk["answer"])
+            yield chunk
+        if vector is not None:
+            store_answer(self.user_id, vector, self.settings, "".join(answer), context, version)
@@ -1,63 +1,222 @@
+import os
 import streamlit as st
-from pymongo import MongoClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
 from datetime import datetime
+from modules.history import window_history
+from modules.llm import get_llm
+from modules.write_behind import WriteBehind
+from modules.db import get_collection
 
-# === MongoDB Setup ===
-MONGO_URI = st.secrets["MONGO_URI"]  # store in .streamlit/secrets.toml
-client = MongoClient(MONGO_URI)
-db = client["ragbot_db"]
-chat_collection = db["chat_history"]
-
-# === Load history from MongoDB ===
-def load_user_chat(user_id):
-    chat_doc = chat_collection.find_one({"user_id": user_id})
-    if chat_doc and "messages" in chat_doc:
-        return chat_doc["messages"]
-    return []
-
-# === Save one message to MongoDB ===
-def save_message(user_id, role, content):
-    chat_collection.update_one(
-        {"user_id": user_id},
-        {"$push": {"messages": {"role": role, "content": content, "timestamp": datetime.utcnow()}}},
-        upsert=True
+# Messages loaded at login; older ones are fetched a page at a time on request
+HISTORY_PAGE_SIZE = int(os.environ.get("RAGBOT_HISTORY_PAGE_SIZE", 50))
+# Longest a page load waits for this user's buffered writes before reading anyway
+REQUEST_FLUSH_TIMEOUT_SECONDS = 2
+# Messages drawn on each rerun; "Load older messages" widens the window by this much
+CHAT_WINDOW = int(os.environ.get("RAGBOT_CHAT_WINDOW", 30))
+
+# === MongoDB collections (shared, lazily connected client from modules.db) ===
+# One document per user for per-conversation state (rolling summary); older deployments kept every message here too
+def _chat_collection():
+    return get_collection("chat_history")
+
+# One document per message: {user_id, ts, role, content, sources}
+def _message_collection():
+    return get_collection("chat_messages")
+
+_indexes_ready = False
+# Chat writes leave the request path: buffered here and bulk-written in the background
+_writes = WriteBehind()
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        _message_collection().create_index([("user_id", ASCENDING), ("ts", ASCENDING), ("_id", ASCENDING)])
+        _indexes_ready = True
+
+
+# === Mongo stores datetimes at millisecond precision; truncate so in-session and reloaded messages compare equal ===
+def _now():
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+# === Move a user's messages out of the old single-document layout (messages array on chat_history) ===
+def migrate_user_chat(user_id):
+    legacy = _chat_collection().find_one({"user_id": user_id, "messages": {"$exists": True}}, {"messages": 1})
+    if not legacy:
+        return 0
+    ops = []
+    for position, message in enumerate(legacy["messages"]):
+        ts = message.get("timestamp") or legacy["_id"].generation_time.replace(tzinfo=None)
+        doc = {k: v for k, v in message.items() if k != "timestamp"}
+        # Keyed on (user, ts, position) so a migration interrupted half-way can simply run again
+        ops.append(UpdateOne(
+            {"user_id": user_id, "ts": ts, "position": position},
+            {"$setOnInsert": {**doc, "user_id": user_id, "ts": ts, "position": position}},
+            upsert=True,
+        ))
+    if ops:
+        _message_collection().bulk_write(ops, ordered=False)
+    _chat_collection().update_one({"_id": legacy["_id"]}, {"$unset": {"messages": ""}})
+    return len(ops)
+
+
+def migrate_all_chats():
+    legacy = _chat_collection().find({"messages": {"$exists": True}}, {"user_id": 1})
+    return sum(migrate_user_chat(doc["user_id"]) for doc in legacy)
+
+
+# === Load one page of history, oldest first: the newest `limit` messages older than `before` (a (ts, _id) cursor) ===
+def load_user_chat(user_id, limit=HISTORY_PAGE_SIZE, before=None):
+    # Another session of this user may have messages still buffered
+    flush_chat_writes(REQUEST_FLUSH_TIMEOUT_SECONDS, user_id)
+    _ensure_indexes()
+    migrate_user_chat(user_id)
+    query = {"user_id": user_id}
+    if before is not None:
+        ts, _id = before
+        query["$or"] = [{"ts": {"$lt": ts}}, {"ts": ts, "_id": {"$lt": _id}}]
+    cursor = _message_collection().find(query).sort([("ts", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+    return list(cursor)[::-1]
+
+# === Every message of a user, oldest first, fetched `page_size` at a time ===
+def iter_user_chat(user_id, page_size=HISTORY_PAGE_SIZE):
+    flush_chat_writes(REQUEST_FLUSH_TIMEOUT_SECONDS, user_id)
+    migrate_user_chat(user_id)
+    query = {"user_id": user_id}
+    while True:
+        page = list(_message_collection().find(query).sort([("ts", ASCENDING), ("_id", ASCENDING)]).limit(page_size))
+        yield from page
+        if len(page) < page_size:
+            return
+        ts, _id = page[-1]["ts"], page[-1]["_id"]
+        query = {"user_id": user_id, "$or": [{"ts": {"$gt": ts}}, {"ts": ts, "_id": {"$gt": _id}}]}
+
+# === Queue one message for MongoDB; returns it as it will be stored ===
+def save_message(user_id, role, content, sources=None):
+    message = {"_id": ObjectId(), "role": role, "content": content, "ts": _now()}
+    if sources:
+        message["sources"] = sources
+    # Upsert on the client-generated _id, so a retried batch never duplicates a message
+    _writes.submit(_message_collection(), UpdateOne(
+        {"_id": message["_id"]}, {"$setOnInsert": {**message, "user_id": user_id}}, upsert=True
+    ), key=user_id)
+    return message
+
+# === Wait for buffered chat writes, only `user_id`'s if given (call on logout; process exit flushes automatically) ===
+def flush_chat_writes(timeout=None, user_id=None):
+    return _writes.flush(timeout, key=user_id)
+
+def chat_write_stats():
+    return _writes.stats()
+
+# === Rolling summary of older turns, stored next to the messages ===
+def load_history_summary(user_id):
+    chat_doc = _chat_collection().find_one({"user_id": user_id}, {"summary": 1})
+    return chat_doc.get("summary") if chat_doc else None
+
+def save_history_summary(user_id, summary):
+    _writes.submit(
+        _chat_collection(), UpdateOne({"user_id": user_id}, {"$set": {"summary": summary}}, upsert=True), key=user_id
     )
 
-# === Display all messages in chat UI ===
+# === File/page citations for the documents an answer was based on ===
+def _sources(docs):
+    sources = []
+    for doc in docs:
+        source = {"file": doc.metadata.get("file_name", doc.metadata.get("source", "")), "page": doc.metadata.get("page")}
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+def _render_sources(sources):
+    if sources:
+        st.caption("Sources: " + ", ".join(
+            f"{s['file']} (p. {s['page'] + 1})" if isinstance(s.get("page"), int) else s["file"] for s in sources
+        ))
+
+# === Yield answer tokens from chain.stream, collecting the retrieved documents on the side ===
+def _stream_answer(chain, inputs, docs):
+    for chunk in chain.stream(inputs):
+        if "context" in chunk:
+            docs.extend(chunk["context"])
+        if "answer" in chunk:
+            yield chunk["answer"]
+
+# === Position of the oldest loaded message, or None once the whole history is loaded ===
+def _page_cursor(messages, limit):
+    if len(messages) < limit or not messages:
+        return None
+    return messages[0]["ts"], messages[0]["_id"]
+
+def load_older_messages(user_id):
+    cursor = st.session_state.get("history_cursor")
+    if cursor is None:
+        return
+    older = load_user_chat(user_id, before=cursor)
+    st.session_state.messages[:0] = older
+    st.session_state.history_cursor = _page_cursor(older, HISTORY_PAGE_SIZE)
+
+# === Display the latest CHAT_WINDOW messages; older ones are shown (and paged in from MongoDB) on request ===
 def display_chat_history():
     user_id = st.session_state.get("user", {}).get("email", "guest")
     if "messages" not in st.session_state:
         st.session_state.messages = load_user_chat(user_id)
+        st.session_state.history_cursor = _page_cursor(st.session_state.messages, HISTORY_PAGE_SIZE)
+    window = st.session_state.setdefault("chat_window", CHAT_WINDOW)
+
+    if len(st.session_state.messages) > window or st.session_state.get("history_cursor") is not None:
+        if st.button("Load older messages", key="load-older-messages"):
+            window = st.session_state.chat_window = window + CHAT_WINDOW
+            if window > len(st.session_state.messages):
+                load_older_messages(user_id)
 
-    for msg in st.session_state.messages:
-        st.chat_message(msg["role"]).markdown(msg["content"])
+    # Rerun cost depends on the window, not on the length of the conversation
+    for msg in st.session_state.messages[-window:]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+            _render_sources(msg.get("sources"))
 
 # === Handle user prompt and response ===
-def handle_user_input(chain):
+def handle_user_input(chain, stream=True):
     user_id = st.session_state.get("user", {}).get("email", "guest")
     user_input = st.chat_input("Pass your prompt here")
     if not user_input:
         return
 
     st.chat_message("user").markdown(user_input)
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    save_message(user_id, "user", user_input)
+    st.session_state.messages.append(save_message(user_id, "user", user_input))
 
-    # Exclude last message (current user input) from chat history
-    chat_history = [(m["role"], m["content"]) for m in st.session_state.messages[:-1]]
+    if "history_summary" not in st.session_state:
+        st.session_state.history_summary = load_history_summary(user_id)
 
     try:
-        result = chain.invoke({"input": user_input, "chat_history": chat_history})
-        response = result["answer"] if "answer" in result else result.get("result", "")
-        st.chat_message("assistant").markdown(response)
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        save_message(user_id, "assistant", response)
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
+        # Exclude last message (current user input); older turns beyond the token budget are summarized
+        chat_history, summary = window_history(
+            st.session_state.messages[:-1], st.session_state.history_summary, get_llm()
+        )
+        if summary != st.session_state.history_summary:
+            st.session_state.history_summary = summary
+            save_history_summary(user_id, summary)
 
+        inputs = {"input": user_input, "chat_history": chat_history}
 
-# === Download chat as text ===
-def download_chat_history():
-    if st.session_state.get("messages"):
-        content = "\n\n".join([f"{m['role'].upper()}: {m['content']}" for m in st.session_state.messages])
-        st.download_button("💾 Download Chat History", content, file_name="chat_history.txt", mime="text/plain")
+        with st.chat_message("assistant"):
+            if stream:
+                # Tokens are written into the bubble as Groq produces them
+                docs = []
+                response = st.write_stream(_stream_answer(chain, inputs, docs))
+            else:
+                result = chain.invoke(inputs)
+                response = result["answer"] if "answer" in result else result.get("result", "")
+                docs = result.get("context", [])
+                st.markdown(response)
+            sources = _sources(docs)
+            _render_sources(sources)
+
+        # Persisted once, after the full answer is known
+        st.session_state.messages.append(save_message(user_id, "assistant", response, sources))
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
@@ -1,5 +1,8 @@
 import streamlit as st
 from langchain.vectorstores import Chroma
+from modules.embeddings import embedding_stats
+from modules.db import mongo_health, mongo_pool_stats
+from modules.chat import chat_write_stats
 
 def inspect_chroma(vectorstore):
     st.sidebar.markdown("🧪 **ChromaDB Inspector**")
@@ -12,6 +15,32 @@ def inspect_chroma(vectorstore):
         st.sidebar.error("Could not fetch document count.")
         st.sidebar.code(str(e))
 
+    for model_name, stats in embedding_stats().items():
+        if "load_seconds" in stats:
+            st.sidebar.caption(
+                f"🧠 {model_name}: loaded in {stats['load_seconds']}s, "
+                f"+{stats['rss_delta_mb']} MB (process {stats['rss_mb']} MB)"
+            )
+        if stats.get("chunks_per_sec"):
+            st.sidebar.caption(
+                f"⚡ {stats['chunks_per_sec']} chunks/s over {stats['chunks']} chunks "
+                f"(batch {stats['batch_size'] or 'calibrating'}, {stats['threads']} threads)"
+            )
+
+    healthy, detail = mongo_health()
+    if healthy:
+        st.sidebar.caption(f"🍃 MongoDB reachable ({detail} ms ping)")
+    else:
+        st.sidebar.error(f"MongoDB unreachable: {detail}")
+    pool = mongo_pool_stats()
+    writes = chat_write_stats()
+    st.sidebar.caption(
+        f"🍃 MongoDB pool: {pool['in_use']}/{pool['open']} connections in use, "
+        f"{pool['checkouts']} checkouts, {pool['checkout_failures']} failed · "
+        f"{writes['pending']} chat writes pending, {writes['written']} written in {writes['batches']} batches, "
+        f"{writes['dropped']} dropped"
+    )
+
     # Search inside the vectorstore
     query = st.sidebar.text_input("🔍 Test a query against ChromaDB")
 
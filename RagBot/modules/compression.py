@@ -0,0 +1,75 @@
+import os
+import re
+from operator import itemgetter
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from modules.embeddings import get_embeddings
+from modules.history import estimate_tokens
+
+# Tokens of retrieved context sent to the QA prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAGBOT_CONTEXT_TOKENS", 600))
+# Sentences less similar to the question than this are dropped even if the budget has room
+MIN_SENTENCE_SCORE = float(os.environ.get("RAGBOT_MIN_SENTENCE_SCORE", 0.2))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+# === Keep only the sentences closest to the question, within the token budget ===
+def compress_documents(query, docs, budget=CONTEXT_TOKEN_BUDGET):
+    if sum(estimate_tokens(doc.page_content) for doc in docs) <= budget:
+        return docs
+
+    sentences = [(d, i, s) for d, doc in enumerate(docs) for i, s in enumerate(split_sentences(doc.page_content))]
+    if not sentences:
+        return docs
+
+    # `query` is the question retrieval searched with, so its vector comes from the shared query cache
+    embeddings = get_embeddings()
+    query_vector = _unit_rows(embeddings.embed_query(query))
+    # Plain model call: per-turn sentences don't belong in the on-disk ingestion cache
+    sentence_vectors = _unit_rows(embeddings.embed_documents([s for _, _, s in sentences]))
+    scores = sentence_vectors @ query_vector
+
+    selected, used = set(), 0
+    for n in np.argsort(-scores):
+        if selected and scores[n] < MIN_SENTENCE_SCORE:
+            break
+        cost = estimate_tokens(sentences[n][2])
+        if used + cost <= budget:
+            selected.add(n)
+            used += cost
+
+    compressed = []
+    for d, doc in enumerate(docs):
+        kept = [(i, s) for n, (doc_index, i, s) in enumerate(sentences) if doc_index == d and n in selected]
+        if not kept:
+            continue
+        parts = [kept[0][1]]
+        for (prev, _), (i, s) in zip(kept, kept[1:]):
+            parts.append(("… " if i != prev + 1 else "") + s)
+        # Metadata (file, page) is untouched so citations still point at the original chunk
+        compressed.append(Document(page_content=" ".join(parts), metadata=dict(doc.metadata)))
+    return compressed
+
+
+# === Retriever runnable whose documents are compressed against the question it searched with ===
+# `condense` maps {"input", "chat_history"} to the retrieval query (the raw input if not given)
+def with_compression(retriever, condense=None, budget=CONTEXT_TOKEN_BUDGET):
+    return (
+        RunnablePassthrough.assign(query=condense or itemgetter("input"))
+        | RunnablePassthrough.assign(documents=itemgetter("query") | retriever)
+        | RunnableLambda(lambda x: compress_documents(x["query"], x["documents"], budget))
+    ).with_config(run_name="compressed_retriever")
@@ -0,0 +1,73 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+# Rewrites remembered per (recent history, question)
+MAX_CACHED_REWRITES = 512
+# Only the last few messages decide what a follow-up refers to
+HISTORY_KEY_MESSAGES = 4
+
+# Words that usually point back into the conversation
+_REFERENCES = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "above", "previous", "earlier", "former", "latter",
+    "same", "there", "then",
+}
+_FOLLOW_UP_STARTS = (
+    "and ", "also ", "but ", "so ", "or ", "what about", "how about", "why", "more", "elaborate",
+    "explain further", "explain more", "continue", "go on", "tell me more", "give an example", "another",
+)
+_MIN_STANDALONE_WORDS = 5
+
+_rewrites = OrderedDict()
+_lock = threading.Lock()
+
+
+# === Cheap heuristic: does the question make sense without the chat history? ===
+def is_standalone(question):
+    text = question.strip().lower()
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < _MIN_STANDALONE_WORDS:
+        return False
+    if text.startswith(_FOLLOW_UP_STARTS):
+        return False
+    return not any(word in _REFERENCES for word in words)
+
+
+def _needs_rewrite(inputs):
+    return bool(inputs.get("chat_history")) and not is_standalone(inputs["input"])
+
+
+def _rewrite_key(inputs):
+    recent = inputs["chat_history"][-HISTORY_KEY_MESSAGES:]
+    raw = repr((" ".join(inputs["input"].lower().split()), [repr(m) for m in recent]))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# === Runnable turning {"input", "chat_history"} into the standalone question used for retrieval ===
+# Only calls the LLM to rephrase when the question depends on history
+def create_query_condenser(llm, prompt):
+    rewrite_chain = prompt | llm | StrOutputParser()
+
+    def condense(inputs):
+        if not _needs_rewrite(inputs):
+            return inputs["input"]
+
+        key = _rewrite_key(inputs)
+        with _lock:
+            if key in _rewrites:
+                _rewrites.move_to_end(key)
+                return _rewrites[key]
+
+        question = rewrite_chain.invoke(inputs)
+        with _lock:
+            _rewrites[key] = question
+            while len(_rewrites) > MAX_CACHED_REWRITES:
+                _rewrites.popitem(last=False)
+        return question
+
+    return RunnableLambda(condense).with_config(run_name="condense_question")
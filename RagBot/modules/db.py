@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+import streamlit as st
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+# Database used by the app's collections
+MONGO_DB_NAME = "ragbot_db"
+# Pool per process, shared by every session; sized for concurrent sessions without exhausting the server
+MONGO_MAX_POOL_SIZE = int(os.environ.get("RAGBOT_MONGO_MAX_POOL", 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("RAGBOT_MONGO_MIN_POOL", 0))
+MONGO_MAX_IDLE_MS = int(os.environ.get("RAGBOT_MONGO_MAX_IDLE_MS", 5 * 60 * 1000))
+# Fail fast instead of hanging a rerun when the server is unreachable
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("RAGBOT_MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("RAGBOT_MONGO_SELECTION_TIMEOUT_MS", 5000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("RAGBOT_MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+HEALTH_CHECK_SECONDS = 30
+
+_client = None
+_collections = {}
+_lock = threading.Lock()
+_health = None  # (checked at, (ok, latency ms or error))
+
+
+# === Connection pool counters, fed by pymongo's pool events ===
+class PoolMetrics(ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.in_use = 0
+        self.pool_clears = 0
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(closed=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._bump(checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._bump(checked_out=1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._bump(in_use=-1)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.in_use,
+                "created": self.created,
+                "checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+# === The process-wide client, created on first use (constructing it does not block on the network) ===
+def get_mongo_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(
+                    st.secrets["MONGO_URI"],  # store in .streamlit/secrets.toml
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    retryWrites=True,
+                    event_listeners=[pool_metrics],
+                )
+    return _client
+
+
+def get_collection(name, db_name=MONGO_DB_NAME):
+    key = (db_name, name)
+    if key not in _collections:
+        # Cached so callers share one object (the write-behind buffer groups operations by collection)
+        _collections.setdefault(key, get_mongo_client()[db_name][name])
+    return _collections[key]
+
+
+# === Round-trip check against the server; returns (ok, latency in ms or error message) ===
+# The result is reused for HEALTH_CHECK_SECONDS so showing it on every rerun doesn't ping every time
+def mongo_health():
+    global _health
+    now = time.monotonic()
+    if _health is not None and now - _health[0] < HEALTH_CHECK_SECONDS:
+        return _health[1]
+    start = time.perf_counter()
+    try:
+        get_mongo_client().admin.command("ping")
+        result = (True, round((time.perf_counter() - start) * 1000, 1))
+    except Exception as e:
+        result = (False, str(e))
+    _health = (now, result)
+    return result
+
+
+def mongo_pool_stats():
+    return pool_metrics.as_dict()
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from modules.embeddings import DEFAULT_MODEL, get_batched_embeddings, model_key
+
+CACHE_DIR = os.environ.get("RAGBOT_EMBED_CACHE_DIR", "./embedding_cache")
+# Max vectors kept per model; least recently used ones are overwritten past this
+CACHE_CAPACITY = int(os.environ.get("RAGBOT_EMBED_CACHE_CAPACITY", 200_000))
+CACHE_DTYPE = os.environ.get("RAGBOT_EMBED_CACHE_DTYPE", "float16")
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{_normalize(text)}".encode("utf-8")).hexdigest()
+
+
+# === Disk-backed vector cache: sqlite index + memory-mapped fixed-size vector file ===
+class EmbeddingCache:
+    def __init__(self, directory, model_name, capacity=CACHE_CAPACITY, dtype=CACHE_DTYPE):
+        os.makedirs(directory, exist_ok=True)
+        self.model_name = model_name
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._vectors = None
+        self._tick = 0
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        if meta and (meta.get("dtype") != self.dtype.name or int(meta.get("capacity", 0)) != capacity):
+            # Layout changed since the cache was written; start over rather than misread the file
+            self._reset()
+        elif "dim" in meta:
+            self._open(int(meta["dim"]))
+        self._tick = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM entries").fetchone()[0]
+
+    def _reset(self):
+        self._db.execute("DELETE FROM entries")
+        self._db.execute("DELETE FROM meta")
+        self._db.commit()
+        if os.path.exists(self._vectors_path):
+            os.remove(self._vectors_path)
+
+    def _open(self, dim, create=False):
+        mode = "w+" if create or not os.path.exists(self._vectors_path) else "r+"
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode, shape=(self.capacity, dim))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            [("dim", str(dim)), ("dtype", self.dtype.name), ("capacity", str(self.capacity))],
+        )
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    # === Look up vectors by key; returns {key: float32 vector} for hits only ===
+    def get_many(self, keys):
+        if not keys or self._vectors is None:
+            return {}
+        with self._lock:
+            hits = {}
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                hits.update(rows)
+            if not hits:
+                return {}
+            self._tick += 1
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(self._tick, k) for k in hits])
+            self._db.commit()
+            # Copied out: with a float32 cache a plain asarray() would be a view that a later eviction overwrites
+            return {key: np.array(self._vectors[slot], dtype=np.float32, copy=True) for key, slot in hits.items()}
+
+    # === Store {key: vector}, evicting least recently used entries when full ===
+    def put_many(self, items):
+        if not items:
+            return
+        items = list(items.items())[-self.capacity:]
+        with self._lock:
+            if self._vectors is None:
+                self._open(len(items[0][1]), create=True)
+
+            new = [(k, v) for k, v in items if not self._db.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (k,)).fetchone()]
+            if not new:
+                return
+
+            # Occupied slots are always 0..count-1: fill free ones first, then reuse the LRU ones
+            count = len(self)
+            free = min(self.capacity - count, len(new))
+            slots = list(range(count, count + free))
+            evicted = self._db.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (len(new) - free,)
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+
+            self._tick += 1
+            for (key, vector), slot in zip(new, slots):
+                self._vectors[slot] = np.asarray(vector, dtype=self.dtype)
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, self._tick) for (key, _), slot in zip(new, slots)],
+            )
+            self._db.commit()
+
+
+# === Process-wide cache per model ===
+def get_embedding_cache(model_name=DEFAULT_MODEL):
+    with _caches_lock:
+        if model_name not in _caches:
+            directory = os.path.join(CACHE_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+            _caches[model_name] = EmbeddingCache(directory, model_name)
+        return _caches[model_name]
+
+
+# === Embeddings wrapper that only runs the model for texts not already cached ===
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.cache.model_name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            cached.update({key: np.asarray(vector, dtype=np.float32) for key, vector in fresh.items()})
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+def get_cached_embeddings(model_name=DEFAULT_MODEL):
+    return CachedEmbeddings(get_batched_embeddings(model_name), get_embedding_cache(model_key(model_name)))
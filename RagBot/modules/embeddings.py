@@ -0,0 +1,265 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "all-MiniLM-L12-v2"
+# Recent query vectors kept per model, so the same question is embedded once per turn
+QUERY_CACHE_SIZE = 256
+# torch intra-op threads used for encoding (defaults to one per core)
+EMBED_THREADS = int(os.environ.get("RAGBOT_EMBED_THREADS", 0)) or os.cpu_count() or 1
+# Batch sizes tried by the calibration run; the fastest one is used from then on
+CALIBRATION_BATCH_SIZES = (8, 16, 32, 64, 128)
+# "torch" (sentence-transformers default), "onnx" (ONNX Runtime) or "onnx-int8" (dynamically quantized ONNX)
+EMBEDDING_BACKEND = os.environ.get("RAGBOT_EMBEDDING_BACKEND", "torch")
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+# Where quantized ONNX exports are written; ONNX_QUANT_CONFIG is one of arm64, avx2, avx512, avx512_vnni
+ONNX_DIR = os.environ.get("RAGBOT_ONNX_DIR", "./onnx_models")
+ONNX_QUANT_CONFIG = os.environ.get("RAGBOT_ONNX_QUANT_CONFIG", "avx2")
+
+# One loaded model per (name, backend) for the whole process (shared by every Streamlit session)
+_models = {}
+_stats = {}
+_load_locks = {}
+_registry_lock = threading.Lock()
+_executors = {}
+
+
+# === Resident memory of this process in MB ===
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is in KB on Linux; peak rather than current, but close enough for reporting
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# === Thread-safe handle around a loaded model ===
+class SharedEmbeddings(Embeddings):
+    # HF fast tokenizers are not safe for concurrent use, so encoding is serialized per model
+    def __init__(self, model_name, model):
+        self.model_name = model_name
+        self.model = model
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+            vector = self.model.embed_query(text)
+            self._queries[text] = vector
+            if len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+            return vector
+
+
+# === Registry key; vectors from different backends differ slightly, so they are kept apart ===
+def model_key(model_name=DEFAULT_MODEL, backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+# === sentence-transformers arguments for the ONNX backends (exports the int8 model on first use) ===
+def _onnx_model(model_name, quantize):
+    if not quantize:
+        return model_name, {"backend": "onnx"}
+
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    save_dir = os.path.join(ONNX_DIR, model_name.replace("/", "_"))
+    weights = "quint8" if ONNX_QUANT_CONFIG == "avx2" else "qint8"
+    file_name = f"onnx/model_{weights}_{ONNX_QUANT_CONFIG}.onnx"
+    if not os.path.exists(os.path.join(save_dir, file_name)):
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save_pretrained(save_dir)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANT_CONFIG, save_dir)
+    return save_dir, {"backend": "onnx", "model_kwargs": {"file_name": file_name}}
+
+
+def _load(model_name, backend):
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    key = model_key(model_name, backend)
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    if backend == "torch":
+        model = HuggingFaceEmbeddings(model_name=model_name)
+    else:
+        path, model_kwargs = _onnx_model(model_name, quantize=backend == "onnx-int8")
+        model = HuggingFaceEmbeddings(model_name=path, model_kwargs=model_kwargs)
+    load_seconds = time.perf_counter() - start
+    rss_after = _rss_mb()
+
+    _stats[key] = {
+        "load_seconds": round(load_seconds, 3),
+        "rss_mb": round(rss_after, 1),
+        "rss_delta_mb": round(rss_after - rss_before, 1),
+    }
+    logger.info(
+        "Loaded embedding model %s in %.2fs (+%.0f MB, rss %.0f MB)",
+        key, load_seconds, rss_after - rss_before, rss_after,
+    )
+    return SharedEmbeddings(key, model)
+
+
+# === Get (loading once per process) the shared embedding model ===
+def get_embeddings(model_name=DEFAULT_MODEL, backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    key = model_key(model_name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _load_locks.setdefault(key, threading.Lock())
+
+    # Concurrent first callers wait on the same load instead of loading twice
+    with lock:
+        if key not in _models:
+            _models[key] = _load(model_name, backend)
+    return _models[key]
+
+
+# === Batched encoder for ingestion: tuned threads, calibrated batch size, throughput stats ===
+class BatchedEmbeddings(Embeddings):
+    def __init__(self, shared, threads=EMBED_THREADS):
+        self.shared = shared
+        self.threads = threads
+        self.batch_size = None
+        self._rates = {}  # batch size -> chunks/sec measured during calibration
+        self._chunks = 0
+        self._seconds = 0.0
+        self._ready = False
+
+    def _encode(self, texts, batch_size):
+        hf = self.shared.model
+        # SentenceTransformer.encode sorts each call's texts by length before batching, so padding stays minimal
+        kwargs = {**hf.encode_kwargs, "batch_size": batch_size, "show_progress_bar": False}
+        start = time.perf_counter()
+        vectors = hf.client.encode(texts, **kwargs)
+        elapsed = time.perf_counter() - start
+        self._chunks += len(texts)
+        self._seconds += elapsed
+        return vectors.tolist(), elapsed
+
+    def _prepare(self):
+        if self._ready:
+            return
+        import torch
+
+        torch.set_num_threads(self.threads)
+        # Warm-up so the first calibration batch isn't charged for lazy initialisation
+        self.shared.model.client.encode(["warm up"], show_progress_bar=False)
+        self._ready = True
+
+    def embed_documents(self, texts):
+        vectors = []
+        with self.shared._lock:
+            self._prepare()
+            pos = 0
+            # Calibration uses real chunks: each candidate size encodes a couple of batches and is timed
+            for candidate in CALIBRATION_BATCH_SIZES:
+                if self.batch_size is not None or candidate in self._rates:
+                    continue
+                segment = texts[pos:pos + candidate * 2]
+                if len(segment) < candidate * 2:
+                    break
+                out, elapsed = self._encode(segment, candidate)
+                vectors.extend(out)
+                self._rates[candidate] = len(segment) / elapsed
+                pos += len(segment)
+            if self.batch_size is None and len(self._rates) == len(CALIBRATION_BATCH_SIZES):
+                self.batch_size = max(self._rates, key=self._rates.get)
+                logger.info("Embedding batch size %d (%s)", self.batch_size,
+                            ", ".join(f"{b}: {r:.0f}/s" for b, r in sorted(self._rates.items())))
+
+            if pos < len(texts):
+                batch_size = self.batch_size or max(self._rates, key=self._rates.get, default=32)
+                vectors.extend(self._encode(texts[pos:], batch_size)[0])
+        return vectors
+
+    def embed_query(self, text):
+        return self.shared.embed_query(text)
+
+    def stats(self):
+        return {
+            "chunks": self._chunks,
+            "chunks_per_sec": round(self._chunks / self._seconds, 1) if self._seconds else None,
+            "batch_size": self.batch_size,
+            "threads": self.threads,
+        }
+
+
+def get_batched_embeddings(model_name=DEFAULT_MODEL, backend=None):
+    shared = get_embeddings(model_name, backend)
+    with _registry_lock:
+        if shared.model_name not in _executors:
+            _executors[shared.model_name] = BatchedEmbeddings(shared)
+        return _executors[shared.model_name]
+
+
+# === Load the model ahead of the first upload/query ===
+def warm_embeddings(model_name=DEFAULT_MODEL, background=True):
+    if model_key(model_name) in _models:
+        return None
+    if not background:
+        return get_embeddings(model_name)
+    thread = threading.Thread(target=get_embeddings, args=(model_name,), daemon=True)
+    thread.start()
+    return thread
+
+
+# === Load time and memory per loaded model ===
+def embedding_stats():
+    stats = {name: dict(values) for name, values in _stats.items()}
+    for name, executor in _executors.items():
+        stats.setdefault(name, {}).update(executor.stats())
+    return stats
+
+
+# === Compare a backend against the torch reference on sample texts ===
+PARITY_SAMPLE = (
+    "What is the refund policy for annual subscriptions?",
+    "The supplier shall deliver the goods within thirty (30) days of the purchase order.",
+    "Error code E-4021 indicates that the device could not reach the licensing server.",
+    "Section 7.3 limits the liability of either party to the fees paid in the preceding twelve months.",
+    "Replace part no. 55-1182-A before recalibrating the sensor.",
+)
+
+
+def embedding_parity(texts=PARITY_SAMPLE, model_name=DEFAULT_MODEL, backend=None):
+    import numpy as np
+
+    texts = list(texts)
+    reference = np.asarray(get_embeddings(model_name, "torch").embed_documents(texts), dtype=np.float32)
+    candidate = np.asarray(get_embeddings(model_name, backend).embed_documents(texts), dtype=np.float32)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = (reference * candidate).sum(axis=1)
+
+    # Nearest-neighbour agreement: does each text rank the other texts the same way under both backends?
+    ref_rank = np.argsort(-(reference @ reference.T), axis=1)
+    cand_rank = np.argsort(-(candidate @ candidate.T), axis=1)
+    return {
+        "backend": backend or EMBEDDING_BACKEND,
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        "top1_agreement": float((ref_rank[:, 1] == cand_rank[:, 1]).mean()) if len(texts) > 1 else 1.0,
+    }
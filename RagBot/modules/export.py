@@ -0,0 +1,199 @@
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+
+from modules.chat import iter_user_chat
+
+# Finished exports are written here and removed once downloaded or after EXPORT_TTL_SECONDS
+EXPORT_DIR = os.environ.get("RAGBOT_EXPORT_DIR", "./chat_exports")
+EXPORT_TTL_SECONDS = int(os.environ.get("RAGBOT_EXPORT_TTL", 60 * 60))
+# Messages read from MongoDB per query while exporting
+EXPORT_PAGE_SIZE = 500
+EXPORT_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="chat-export")
+_exports = {}  # export_id -> {"path", "format", "compress", "messages", "future"}
+_lock = threading.Lock()
+
+
+def _citations(message):
+    return ", ".join(
+        f"{s['file']} (p. {s['page'] + 1})" if isinstance(s.get("page"), int) else s["file"]
+        for s in message.get("sources", [])
+    )
+
+
+def _as_text(message):
+    text = f"{message['role'].upper()}: {message['content']}\n"
+    if message.get("sources"):
+        text += f"Sources: {_citations(message)}\n"
+    return text + "\n"
+
+
+def _as_jsonl(message):
+    record = {
+        "role": message["role"],
+        "content": message["content"],
+        "ts": message["ts"].isoformat() if message.get("ts") else None,
+        "sources": message.get("sources", []),
+    }
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _as_markdown(message):
+    stamp = f" · {message['ts']:%Y-%m-%d %H:%M} UTC" if message.get("ts") else ""
+    text = f"### {message['role'].capitalize()}{stamp}\n\n{message['content']}\n\n"
+    if message.get("sources"):
+        text += f"*Sources: {_citations(message)}*\n\n"
+    return text
+
+
+# format -> (file extension, mime type, header, per-message formatter)
+EXPORT_FORMATS = {
+    "Text": ("txt", "text/plain", "", _as_text),
+    "JSON Lines": ("jsonl", "application/x-ndjson", "", _as_jsonl),
+    "Markdown": ("md", "text/markdown", "# RagBot chat history\n\n", _as_markdown),
+}
+
+
+# === The transcript as a stream of text pieces, one message at a time, read from MongoDB page by page ===
+def iter_export(user_id, fmt, counter=None):
+    _, _, header, formatter = EXPORT_FORMATS[fmt]
+    if header:
+        yield header
+    for message in iter_user_chat(user_id, page_size=EXPORT_PAGE_SIZE):
+        yield formatter(message)
+        if counter is not None:
+            counter["messages"] += 1
+
+
+# === Write an export file; only one page of messages is in memory at any time ===
+def write_export(user_id, fmt, path, compress=False, counter=None):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        for piece in iter_export(user_id, fmt, counter):
+            f.write(piece)
+    return path
+
+
+def _purge_old_exports():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_TTL_SECONDS
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # removed by another session's purge or download meanwhile
+    with _lock:
+        for export_id, export in list(_exports.items()):
+            if export["future"].done() and not os.path.exists(export["path"]):
+                del _exports[export_id]
+
+
+# === Start producing an export; returns its id. In the background by default ===
+def start_export(user_id, fmt, compress=True, background=True):
+    _purge_old_exports()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    export_id = uuid.uuid4().hex
+    extension = EXPORT_FORMATS[fmt][0] + (".gz" if compress else "")
+    export = {"path": os.path.join(EXPORT_DIR, f"{export_id}.{extension}"), "format": fmt, "compress": compress,
+              "messages": 0}
+    if background:
+        export["future"] = _executor.submit(write_export, user_id, fmt, export["path"], compress, export)
+    else:
+        export["future"] = Future()
+        export["future"].set_result(write_export(user_id, fmt, export["path"], compress, export))
+    with _lock:
+        _exports[export_id] = export
+    return export_id
+
+
+def export_status(export_id):
+    with _lock:
+        export = _exports.get(export_id)
+    if export is None:
+        return None
+    future = export["future"]
+    if not future.done():
+        return {**export, "status": "running"}
+    if future.exception() is not None:
+        return {**export, "status": "failed", "error": str(future.exception())}
+    return {**export, "status": "done"}
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# === Forget an export and delete its file; a still-running export deletes its file when it finishes ===
+def discard_export(export_id):
+    with _lock:
+        export = _exports.pop(export_id, None)
+    if export is not None:
+        export["future"].add_done_callback(lambda _: _remove_file(export["path"]))
+
+
+# === Called when the download button is clicked: queue an export with the chosen format ===
+def download_chat_history():
+    user_id = st.session_state.get("user", {}).get("email", "guest")
+    if st.session_state.get("chat_export"):
+        discard_export(st.session_state.chat_export)
+    st.session_state.pop("chat_export_data", None)
+    st.session_state.chat_export = start_export(
+        user_id,
+        st.session_state.get("chat_export_format", "Text"),
+        compress=st.session_state.get("chat_export_gzip", False),
+    )
+
+
+# === Progress of a running export; polls only until it ends, then reruns the page once to show the result ===
+@st.fragment(run_every=2)
+def _show_export_progress(export_id):
+    export = export_status(export_id)
+    if export is None or export["status"] != "running":
+        st.rerun(scope="app")
+    st.caption(f"Preparing export… {export['messages']} messages written")
+
+
+# === Export options, and the current export's progress or download ===
+def show_chat_export():
+    st.selectbox("Export format", list(EXPORT_FORMATS), key="chat_export_format")
+    st.checkbox("Compress export (gzip)", key="chat_export_gzip")
+
+    export_id = st.session_state.get("chat_export")
+    export = export_status(export_id) if export_id else None
+    if export is None:
+        st.session_state.pop("chat_export", None)
+        st.session_state.pop("chat_export_data", None)
+        return
+    if export["status"] == "running":
+        _show_export_progress(export_id)
+    elif export["status"] == "failed":
+        st.error(f"Export failed: {export['error']}")
+        discard_export(export_id)
+        st.session_state.pop("chat_export")
+    else:
+        # Read from disk once per export, not on every rerun until it is downloaded
+        if st.session_state.get("chat_export_data", (None,))[0] != export_id:
+            with open(export["path"], "rb") as f:
+                st.session_state.chat_export_data = (export_id, f.read())
+        extension, mime = EXPORT_FORMATS[export["format"]][:2]
+        if export["compress"]:
+            extension, mime = extension + ".gz", "application/gzip"
+        data = st.session_state.chat_export_data[1]
+        if st.download_button("💾 Download Chat History", data, file_name=f"chat_history.{extension}", mime=mime):
+            discard_export(export_id)
+            st.session_state.pop("chat_export")
+            st.session_state.pop("chat_export_data")
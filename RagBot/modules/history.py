@@ -0,0 +1,78 @@
+import os
+from datetime import datetime
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+# Tokens of chat history sent with each turn (llama3-8b-8192 has an 8k window for everything)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("RAGBOT_HISTORY_TOKENS", 1500))
+# Share of the budget the rolling summary may use; the rest is recent turns verbatim
+SUMMARY_SHARE = 0.25
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of a conversation between a user and a document assistant. "
+     "Merge the new messages into the existing summary. Keep names, numbers, documents and open questions; "
+     "drop small talk. Reply with the updated summary only, in under {max_words} words."),
+    ("human", "Existing summary:\n{summary}\n\nNew messages:\n{messages}"),
+])
+
+
+# === Rough token count (~4 characters per token for English text) ===
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# === Index where the newest messages fitting in `budget` tokens begin ===
+def _window_start(messages, budget):
+    used = 0
+    start = len(messages)
+    while start > 0:
+        cost = estimate_tokens(messages[start - 1]["content"])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def summarize_messages(summary, messages, llm):
+    max_words = int(HISTORY_TOKEN_BUDGET * SUMMARY_SHARE * 0.75)
+    chain = summary_prompt | llm | StrOutputParser()
+    return chain.invoke({
+        "summary": summary or "(none)",
+        "messages": "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages),
+        "max_words": max_words,
+    }).strip()
+
+
+# === Number of leading messages already folded into the summary ===
+# `upto` is the timestamp of the last folded message, so it stays valid when only the latest page of history is loaded
+def _folded_count(messages, upto):
+    if upto is None:
+        return 0
+    return sum(1 for m in messages if m["ts"] <= upto)
+
+
+# === Fit prior messages into the token budget: rolling summary + recent turns verbatim ===
+# `state` is {"text": summary, "upto": "ts" of the last message folded into it}; returns (chat_history, state)
+def window_history(messages, state, llm, budget=HISTORY_TOKEN_BUDGET):
+    state = dict(state or {"text": "", "upto": None})
+    if not isinstance(state["upto"], (datetime, type(None))):
+        # Summary saved when "upto" was a list index; rebuild it
+        state = {"text": "", "upto": None}
+    folded = _folded_count(messages, state["upto"])
+    recent_budget = int(budget * (1 - SUMMARY_SHARE))
+
+    if _window_start(messages, recent_budget) > folded:
+        # Fold aged-out turns into the summary, leaving headroom so this doesn't run every turn
+        cut = max(_window_start(messages, recent_budget // 2), folded)
+        state["text"] = summarize_messages(state["text"], messages[folded:cut], llm)
+        state["upto"] = messages[cut - 1]["ts"]
+        folded = cut
+
+    chat_history = []
+    if state["text"]:
+        chat_history.append(("system", f"Summary of the earlier conversation: {state['text']}"))
+    chat_history.extend((m["role"], m["content"]) for m in messages[folded:])
+    return chat_history, state
@@ -0,0 +1,274 @@
+import hashlib
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Max items waiting between two stages; this is what keeps memory flat on big uploads
+QUEUE_SIZE = 4
+# Chunks embedded and written to Chroma per batch (the encoder splits these further by its own batch size)
+EMBED_BATCH_SIZE = 256
+
+_DONE = object()
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+# === Counters and per-stage wall time for one ingestion run, reported through a callback ===
+class IngestMetrics:
+    STAGES = ("parse", "split", "embed", "write")
+
+    def __init__(self, callback=None, interval=0.2):
+        self.callback = callback
+        self.interval = interval
+        self.pages_total = 0
+        self.pages_parsed = 0
+        self.pages_done = 0  # pages whose chunks are all written
+        self.chunks = 0
+        self.chunks_embedded = 0
+        self.chunks_reused = 0  # already in the store, not embedded again
+        self.vectors_written = 0
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.finished = False
+        self._last_report = 0.0
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+    # 0.0 until the page total is known; 1.0 only once the run has finished
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        if not self.pages_total:
+            return 0.0
+        return min(self.pages_done / self.pages_total, 0.99)
+
+    def as_dict(self):
+        return {
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "pages_done": self.pages_done,
+            "chunks": self.chunks,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_reused": self.chunks_reused,
+            "vectors_written": self.vectors_written,
+            "seconds": {stage: round(value, 2) for stage, value in self.seconds.items()},
+            "fraction": self.fraction(),
+        }
+
+    # Throttled so a fast pipeline doesn't flood the UI; `force` always reports
+    def report(self, force=False):
+        now = time.monotonic()
+        if self.callback and (force or now - self._last_report >= self.interval):
+            self._last_report = now
+            self.callback(self.as_dict())
+
+    def finish(self):
+        self.finished = True
+        self.report(force=True)
+
+
+# === One-line summary of a metrics dict for progress bars ===
+def describe_progress(metrics):
+    text = (
+        f"{metrics['pages_parsed']}/{metrics['pages_total']} pages parsed · {metrics['chunks']} chunks · "
+        f"{metrics['chunks_embedded']} embedded · {metrics['vectors_written']} written"
+    )
+    if metrics["chunks_reused"]:
+        text += f" · {metrics['chunks_reused']} unchanged"
+    return text
+
+
+def describe_timings(metrics):
+    return " · ".join(f"{stage} {seconds:.1f}s" for stage, seconds in metrics["seconds"].items())
+
+
+# === Queue put that gives up once another stage has failed ===
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+# === Run one pipeline stage in its own thread ===
+def _start_stage(produce, outbox, stop, errors):
+    def run():
+        try:
+            for item in produce():
+                if not _put(outbox, item, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(outbox, _DONE, stop)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# === Deterministic chunk ID: same file, same text, same occurrence -> same ID ===
+def _assign_ids(batch, seen):
+    ids = []
+    for doc in batch:
+        file_key = doc.metadata.get("file_name", doc.metadata.get("source", ""))
+        chunk_hash = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen[(file_key, chunk_hash)]
+        seen[(file_key, chunk_hash)] += 1
+        doc.metadata["chunk_hash"] = chunk_hash
+        ids.append(hashlib.sha256(f"{file_key}\0{chunk_hash}\0{occurrence}".encode("utf-8")).hexdigest())
+    return ids
+
+
+# === Remove chunks of a re-uploaded file that are not part of its new version ===
+def _delete_stale(collection, kept_ids, index=None):
+    for file_name, ids in kept_ids.items():
+        current = collection.get(where={"file_name": file_name}, include=[])["ids"]
+        stale = [chunk_id for chunk_id in current if chunk_id not in ids]
+        if stale:
+            collection.delete(ids=stale)
+            if index is not None:
+                index.delete(stale)
+
+
+def _drain(inbox, stop):
+    while True:
+        item = _get(inbox, stop)
+        if item is _DONE:
+            return
+        yield item
+
+
+# === Stream pages through split -> embed -> upsert with bounded queues between stages ===
+# `index` (a lexical index with add/delete) is kept in step with the chunks written to Chroma.
+# `metrics` (IngestMetrics) is reported from the caller's thread only, so it can drive Streamlit widgets.
+def ingest_pages(pages, vectorstore, embeddings, splitter, batch_size=EMBED_BATCH_SIZE, index=None, cancel=None,
+                 metrics=None):
+    collection = vectorstore._collection
+    metrics = metrics or IngestMetrics()
+    stop = threading.Event()
+    errors = []
+    pages_q = queue.Queue(QUEUE_SIZE)
+    chunks_q = queue.Queue(QUEUE_SIZE)
+    embedded_q = queue.Queue(QUEUE_SIZE)
+    seen = defaultdict(int)
+    kept_ids = defaultdict(set)
+    page_ends = deque()  # running chunk count at the end of each page, in page order
+
+    def parse():
+        page_iter = iter(pages)
+        while True:
+            with metrics.timed("parse"):
+                page = next(page_iter, _DONE)
+            if page is _DONE:
+                return
+            metrics.pages_parsed += 1
+            yield page
+
+    def batches():
+        batch = []
+        for page in _drain(pages_q, stop):
+            with metrics.timed("split"):
+                chunks = splitter.split_documents([page])
+            metrics.chunks += len(chunks)
+            page_ends.append(metrics.chunks)
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def split():
+        for batch in batches():
+            with metrics.timed("split"):
+                ids = _assign_ids(batch, seen)
+                for chunk_id, doc in zip(ids, batch):
+                    if "file_name" in doc.metadata:
+                        kept_ids[doc.metadata["file_name"]].add(chunk_id)
+                # Primary-key lookup: chunks already in the store are not embedded again
+                known = set(collection.get(ids=ids, include=[])["ids"])
+            yield ids, batch, known
+
+    def embed():
+        for ids, batch, known in _drain(chunks_q, stop):
+            fresh = [doc.page_content for chunk_id, doc in zip(ids, batch) if chunk_id not in known]
+            with metrics.timed("embed"):
+                vectors = embeddings.embed_documents(fresh) if fresh else []
+            metrics.chunks_embedded += len(fresh)
+            metrics.chunks_reused += len(batch) - len(fresh)
+            yield ids, batch, known, vectors
+
+    threads = [
+        _start_stage(parse, pages_q, stop, errors),
+        _start_stage(split, chunks_q, stop, errors),
+        _start_stage(embed, embedded_q, stop, errors),
+    ]
+
+    # Writes run on the caller's thread; each batch is searchable as soon as it is written
+    processed = 0
+    try:
+        metrics.report(force=True)
+        for ids, batch, known, vectors in _drain(embedded_q, stop):
+            if cancel is not None and cancel.is_set():
+                raise IngestCancelled()
+            fresh = [(chunk_id, doc) for chunk_id, doc in zip(ids, batch) if chunk_id not in known]
+            with metrics.timed("write"):
+                if fresh:
+                    collection.upsert(
+                        ids=[chunk_id for chunk_id, _ in fresh],
+                        embeddings=vectors,
+                        documents=[doc.page_content for _, doc in fresh],
+                        metadatas=[doc.metadata for _, doc in fresh],
+                    )
+                    if index is not None:
+                        index.add([chunk_id for chunk_id, _ in fresh], [doc.page_content for _, doc in fresh])
+                if known:
+                    # Unchanged text may have moved page; refresh its metadata without re-embedding
+                    collection.update(
+                        ids=[chunk_id for chunk_id, doc in zip(ids, batch) if chunk_id in known],
+                        metadatas=[doc.metadata for chunk_id, doc in zip(ids, batch) if chunk_id in known],
+                    )
+            metrics.vectors_written += len(fresh)
+            processed += len(batch)
+            while page_ends and page_ends[0] <= processed:
+                page_ends.popleft()
+                metrics.pages_done += 1
+            metrics.report()
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    with metrics.timed("write"):
+        _delete_stale(collection, kept_ids, index)
+    metrics.pages_done = metrics.pages_parsed
+    metrics.finish()
+    return metrics.vectors_written
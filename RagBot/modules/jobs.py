@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+from modules.ingest import IngestCancelled, describe_progress, describe_timings
+
+logger = logging.getLogger(__name__)
+
+# Uploads are spooled here until their job finishes, so queued/running jobs survive a restart
+JOBS_DIR = os.environ.get("RAGBOT_JOBS_DIR", "./ingest_jobs")
+# Jobs processed at the same time (at most one per user); PDF parsing inside each uses the process pool
+JOB_WORKERS = int(os.environ.get("RAGBOT_INGEST_JOB_WORKERS", 2))
+ACTIVE_STATUSES = ("queued", "running")
+
+_db = None
+_db_lock = threading.Lock()
+_wakeup = threading.Condition()
+_cancel_events = {}  # job_id -> threading.Event for running jobs
+_running_users = set()
+_last_served = {}  # user_id -> time their last job started, for round-robin between users
+_workers = []
+
+
+def _now():
+    return time.time()
+
+
+# === Job database; jobs interrupted by a restart go back to the queue ===
+def _get_db():
+    global _db
+    if _db is None:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        db = sqlite3.connect(os.path.join(JOBS_DIR, "jobs.sqlite"), check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL, error TEXT,
+                total_files INTEGER NOT NULL, done_files INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL, updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT NOT NULL, idx INTEGER NOT NULL, name TEXT NOT NULL, path TEXT NOT NULL,
+                status TEXT NOT NULL, metrics TEXT, PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+            UPDATE jobs SET status = 'queued' WHERE status = 'running';
+            UPDATE job_files SET status = 'queued' WHERE status = 'running';
+        """)
+        # Job databases created before per-file metrics were tracked
+        if "metrics" not in [row["name"] for row in db.execute("PRAGMA table_info(job_files)")]:
+            db.execute("ALTER TABLE job_files ADD COLUMN metrics TEXT")
+        db.commit()
+        _db = db
+    return _db
+
+
+def _execute(sql, params=()):
+    with _db_lock:
+        db = _get_db()
+        rows = db.execute(sql, params).fetchall()
+        db.commit()
+        return rows
+
+
+def _set_job(job_id, **fields):
+    fields["updated"] = _now()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    _execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _cleanup(job_id):
+    shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+
+
+# === Queue an upload for background ingestion; returns the job id ===
+def submit_ingest_job(user_id, uploaded_files):
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    files = []
+    for idx, file in enumerate(uploaded_files):
+        path = os.path.join(job_dir, f"{idx}.pdf")
+        with open(path, "wb") as f:
+            f.write(file.getbuffer())
+        files.append((job_id, idx, file.name, path, "queued"))
+
+    now = _now()
+    with _db_lock:
+        db = _get_db()
+        db.execute(
+            "INSERT INTO jobs (id, user_id, status, total_files, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, user_id, len(files), now, now),
+        )
+        db.executemany("INSERT INTO job_files (job_id, idx, name, path, status) VALUES (?, ?, ?, ?, ?)", files)
+        db.commit()
+
+    start_ingest_workers()
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+
+def cancel_job(job_id):
+    # Same lock as _claim_next_job, so a job can't be claimed half-way through being cancelled
+    with _wakeup:
+        if job_id in _cancel_events:
+            # The worker notices between batches and marks the job cancelled itself
+            _cancel_events[job_id].set()
+            return
+        rows = _execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+        if not rows or rows[0]["status"] != "queued":
+            return
+        _set_job(job_id, status="cancelled")
+        _execute("UPDATE job_files SET status = 'cancelled' WHERE job_id = ?", (job_id,))
+    _cleanup(job_id)
+
+
+def job_status(job_id):
+    rows = _execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    if not rows:
+        return None
+    job = dict(rows[0])
+    job["files"] = []
+    for row in _execute("SELECT idx, name, status, metrics FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,)):
+        job["files"].append({**dict(row), "metrics": json.loads(row["metrics"]) if row["metrics"] else None})
+    return job
+
+
+def user_jobs(user_id, active_only=True):
+    statuses = ACTIVE_STATUSES if active_only else ACTIVE_STATUSES + ("done", "failed", "cancelled")
+    rows = _execute(
+        f"SELECT id FROM jobs WHERE user_id = ? AND status IN ({','.join('?' * len(statuses))}) ORDER BY created",
+        (user_id, *statuses),
+    )
+    return [job_status(row["id"]) for row in rows]
+
+
+# === Fair pick: the queued job of the least recently served user who has nothing running ===
+def _claim_next_job():
+    with _wakeup:
+        rows = _execute("SELECT id, user_id, created FROM jobs WHERE status = 'queued' ORDER BY created")
+        candidates = [row for row in rows if row["user_id"] not in _running_users]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda row: (_last_served.get(row["user_id"], 0), row["created"]))
+        _running_users.add(job["user_id"])
+        _last_served[job["user_id"]] = _now()
+        _cancel_events[job["id"]] = threading.Event()
+        _set_job(job["id"], status="running")
+        return dict(job)
+
+
+def _run_job(job):
+    from modules.vectorstore import ingest_files
+
+    job_id, user_id = job["id"], job["user_id"]
+    cancel = _cancel_events[job_id]
+    try:
+        files = _execute("SELECT idx, name, path, status FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,))
+        for row in files:
+            if row["status"] == "done":
+                continue  # finished before a restart
+            if cancel.is_set():
+                raise IngestCancelled()
+            _execute("UPDATE job_files SET status = 'running' WHERE job_id = ? AND idx = ?", (job_id, row["idx"]))
+
+            def save_metrics(metrics, idx=row["idx"]):
+                _execute("UPDATE job_files SET metrics = ? WHERE job_id = ? AND idx = ?",
+                         (json.dumps(metrics), job_id, idx))
+
+            ingest_files([(row["path"], row["name"])], user_id, cancel=cancel, progress=save_metrics)
+            _execute("UPDATE job_files SET status = 'done' WHERE job_id = ? AND idx = ?", (job_id, row["idx"]))
+            _execute("UPDATE jobs SET done_files = done_files + 1, updated = ? WHERE id = ?", (_now(), job_id))
+        _set_job(job_id, status="done")
+    except IngestCancelled:
+        _execute("UPDATE job_files SET status = 'cancelled' WHERE job_id = ? AND status != 'done'", (job_id,))
+        _set_job(job_id, status="cancelled")
+    except Exception as e:
+        logger.exception("Ingestion job %s failed", job_id)
+        _execute("UPDATE job_files SET status = 'failed' WHERE job_id = ? AND status = 'running'", (job_id,))
+        _set_job(job_id, status="failed", error=str(e))
+    finally:
+        _cleanup(job_id)
+        with _wakeup:
+            _running_users.discard(user_id)
+            _cancel_events.pop(job_id, None)
+            _wakeup.notify_all()
+
+
+def _worker_loop():
+    while True:
+        job = _claim_next_job()
+        if job is None:
+            with _wakeup:
+                _wakeup.wait(timeout=5)
+            continue
+        _run_job(job)
+
+
+# === Start the background workers once per process (also resumes jobs queued before a restart) ===
+def start_ingest_workers(count=JOB_WORKERS):
+    with _wakeup:
+        if _workers:
+            return
+        for _ in range(count):
+            thread = threading.Thread(target=_worker_loop, daemon=True, name="ingest-worker")
+            thread.start()
+            _workers.append(thread)
+
+
+# === Polled status panel for the session's current upload job ===
+@st.fragment(run_every=2)
+def show_ingest_job(user_id):
+    job_id = st.session_state.get("ingest_job")
+    job = job_status(job_id) if job_id else None
+    if job is None:
+        return
+
+    if job["status"] in ACTIVE_STATUSES:
+        done, total = job["done_files"], job["total_files"]
+        current = next((f for f in job["files"] if f["status"] == "running"), None)
+        if job["status"] == "queued":
+            fraction, label = 0.0, "Waiting for a worker…"
+        elif current and current["metrics"]:
+            # Finished files plus the written share of the current one
+            fraction = (done + current["metrics"]["fraction"]) / total
+            label = f"{current['name']} ({done + 1}/{total}): {describe_progress(current['metrics'])}"
+        else:
+            fraction, label = done / total if total else 0.0, f"Processing files ({done}/{total})…"
+        st.progress(min(fraction, 1.0), text=label)
+        for f in job["files"]:
+            if f["status"] == "done":
+                timings = f" ({describe_timings(f['metrics'])})" if f["metrics"] else ""
+                st.caption(f"✅ {f['name']}{timings}")
+            else:
+                st.caption(f"⏳ {f['name']}")
+        if st.button("Cancel upload", key=f"cancel-{job_id}"):
+            cancel_job(job_id)
+        return
+
+    st.session_state.pop("ingest_job")
+    if job["status"] == "done":
+        from modules.store_manager import get_user_store
+
+        st.session_state.vectorstore = get_user_store(user_id)
+        st.session_state.ingest_result = "done"
+    elif job["status"] == "failed":
+        st.session_state.ingest_result = f"failed: {job['error']}"
+    else:
+        st.session_state.ingest_result = "cancelled"
+    # Full rerun so the chat section picks up the new store
+    st.rerun()
+
+
+def show_ingest_result():
+    result = st.session_state.pop("ingest_result", None)
+    if result == "done":
+        st.success("Vector database updated! 🎉")
+    elif result == "cancelled":
+        st.info("Upload cancelled.")
+    elif result:
+        st.error(f"Upload {result}")
@@ -0,0 +1,148 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Identifiers such as "4.2", "55-1182-a" or "e_4021" stay one token (their parts are indexed too)
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "was", "were", "what", "which", "with",
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        parts = re.split(r"[._/-]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in _STOPWORDS)
+    return tokens
+
+
+# === On-disk BM25 inverted index (sqlite), updated incrementally as chunks are written/removed ===
+class BM25Index:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            INSERT OR IGNORE INTO meta (name, value) VALUES ('doc_count', 0), ('total_length', 0);
+        """)
+        self._db.commit()
+
+    def _meta(self):
+        return dict(self._db.execute("SELECT name, value FROM meta"))
+
+    def __len__(self):
+        return self._meta()["doc_count"]
+
+    def _delete_locked(self, ids):
+        removed, removed_length = 0, 0
+        for chunk_id in ids:
+            row = self._db.execute("SELECT length FROM docs WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            self._db.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._db.execute("DELETE FROM docs WHERE chunk_id = ?", (chunk_id,))
+            removed += 1
+            removed_length += row[0]
+        self._db.execute("UPDATE meta SET value = value - ? WHERE name = 'doc_count'", (removed,))
+        self._db.execute("UPDATE meta SET value = value - ? WHERE name = 'total_length'", (removed_length,))
+
+    # === Add (or replace) chunks ===
+    def add(self, ids, texts):
+        with self._lock:
+            self._delete_locked(ids)
+            total_length = 0
+            for chunk_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                total_length += length
+                self._db.execute("INSERT INTO docs (chunk_id, length) VALUES (?, ?)", (chunk_id, length))
+                self._db.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()],
+                )
+            self._db.execute("UPDATE meta SET value = value + ? WHERE name = 'doc_count'", (len(ids),))
+            self._db.execute("UPDATE meta SET value = value + ? WHERE name = 'total_length'", (total_length,))
+            self._db.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_locked(ids)
+            self._db.commit()
+
+    # === Top-k (chunk_id, score) for a query ===
+    def search(self, query, k=10):
+        terms = set(tokenize(query))
+        with self._lock:
+            meta = self._meta()
+            n_docs = meta["doc_count"]
+            if not terms or not n_docs:
+                return []
+            avg_length = meta["total_length"] / n_docs
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._db.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id "
+                    "WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf, length in postings:
+                    scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # === Index chunks written before the lexical index existed ===
+    def backfill(self, collection, page_size=1000):
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            self.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+
+
+# === The lexical index that lives next to a Chroma store's files ===
+def get_lexical_index(vectorstore):
+    directory = vectorstore._persist_directory
+    with _indexes_lock:
+        if directory not in _indexes:
+            os.makedirs(directory, exist_ok=True)
+            index = BM25Index(os.path.join(directory, "bm25.sqlite"))
+            if not len(index) and vectorstore._collection.count():
+                index.backfill(vectorstore._collection)
+            _indexes[directory] = index
+        return _indexes[directory]
+
+
+# === Close the index of a store that is being closed; the next get_lexical_index reopens it ===
+def close_lexical_index(directory):
+    with _indexes_lock:
+        index = _indexes.pop(directory, None)
+    if index is not None:
+        index.close()
@@ -1,24 +1,95 @@
 import os
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains import create_retrieval_chain
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from modules.condense import create_query_condenser
+from modules.answer_cache import AnswerCachingChain
+from modules.retrieval import get_retriever
+from modules.compression import with_compression
 
 load_dotenv()
 
 os.environ["GROQ_API_KEY"] = "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"
 
-def get_llm_chain(vectorstore):
+GROQ_MODEL = "llama3-8b-8192"
+GROQ_TEMPERATURE = 0.7
+# Built chains kept across Streamlit reruns, keyed by vectorstore identity and model settings
+MAX_CACHED_CHAINS = 32
+
+_llms = {}
+_chains = OrderedDict()
+_build_locks = {}  # chain key -> lock held while that chain is being built
+_http_client = None
+_lock = threading.Lock()
+
+
+# === One pooled HTTP client for every Groq call in the process ===
+def _get_http_client():
+    global _http_client
+    if _http_client is None:
+        import httpx
+
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                )
+    return _http_client
+
+
+def get_llm(model_name=GROQ_MODEL, temperature=GROQ_TEMPERATURE):
     from langchain_groq.chat_models import ChatGroq
 
-    llm = ChatGroq(
-        api_key=os.environ["GROQ_API_KEY"],
-        model_name="llama3-8b-8192"
-    )
+    key = (model_name, temperature)
+    if key not in _llms:
+        _llms.setdefault(key, ChatGroq(
+            api_key=os.environ["GROQ_API_KEY"],
+            model_name=model_name,
+            temperature=temperature,
+            http_client=_get_http_client(),
+        ))
+    return _llms[key]
+
+
+# === Reuse the chain for this vectorstore/settings; it is only built on the first call ===
+# With a user_id, repeated questions are answered from that user's semantic answer cache
+def get_llm_chain(vectorstore, model_name=GROQ_MODEL, temperature=GROQ_TEMPERATURE, user_id=None):
+    # The cache entry holds the vectorstore itself, so its id() cannot be reused while cached
+    key = (id(vectorstore), model_name, temperature, user_id)
+    with _lock:
+        if key in _chains:
+            _chains.move_to_end(key)
+            return _chains[key][1]
+        build_lock = _build_locks.setdefault(key, threading.Lock())
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    # Built outside _lock (a BM25 backfill or reranker load can take a while); only callers wanting the
+    # same chain wait for it
+    with build_lock:
+        with _lock:
+            if key in _chains:
+                _chains.move_to_end(key)
+                return _chains[key][1]
+
+        chain = _build_chain(vectorstore, get_llm(model_name, temperature))
+        if user_id is not None:
+            chain = AnswerCachingChain(chain, user_id, (model_name, temperature))
+
+        with _lock:
+            _chains[key] = (vectorstore, chain)
+            _build_locks.pop(key, None)
+            while len(_chains) > MAX_CACHED_CHAINS:
+                _chains.popitem(last=False)
+    return chain
+
+
+def _build_chain(vectorstore, llm):
+    # Vector + BM25 results fused by rank, so exact identifiers are found without raising k
+    retriever = get_retriever(vectorstore, k=3)
 
     # Prompt for rephrasing with chat history
     contextualize_q_system_prompt = (
@@ -46,12 +117,12 @@ def get_llm_chain(vectorstore):
         ("human", "{input}"),
     ])
 
-    # Create the history-aware retriever chain (returns docs based on chat history)
-    history_aware_retriever = create_history_aware_retriever(
-        llm,
-        retriever,
-        contextualize_q_prompt
-    )
+    # Standalone question for retrieval; the rephrase call is skipped for first turns and standalone questions
+    condense_question = create_query_condenser(llm, contextualize_q_prompt)
+
+    # History-aware retriever; only the sentences closest to the condensed question go into {context},
+    # within a token budget
+    history_aware_retriever = with_compression(retriever, condense_question)
 
     # Create the QA chain that takes docs and answers the question
     question_answer_chain = create_stuff_documents_chain(
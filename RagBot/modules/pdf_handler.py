@@ -1,5 +1,24 @@
 import streamlit as st
 import tempfile
+import hashlib
+import io
+import os
+import multiprocessing
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from langchain_core.documents import Document
+
+# Files with more pages than this are split into page ranges parsed by separate workers
+PAGES_PER_TASK = 25
+
+# Worker count for PDF parsing (defaults to one per core)
+INGEST_WORKERS = int(os.environ.get("RAGBOT_INGEST_WORKERS", 0)) or os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
 
 def upload_pdfs():
     with st.sidebar:
@@ -8,10 +27,132 @@ def upload_pdfs():
         submit = st.button(" Submit to DB")
     return uploaded_files, submit
 
-def save_uploaded_files(uploaded_files):
-    file_paths = []
-    for file in uploaded_files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file.read())
-            file_paths.append(tmp.name)
-    return file_paths
+
+# === A PDF source is a file path or an in-memory upload (UploadedFile/BytesIO, bytes, memoryview) ===
+def _buffer(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source)
+    # UploadedFile is a BytesIO: getbuffer() is a view on its bytes, no copy
+    return source.getbuffer()
+
+
+def _open_pdf(source):
+    from pypdf import PdfReader
+
+    if isinstance(source, str):
+        return PdfReader(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return PdfReader(io.BytesIO(source))
+    source.seek(0)
+    return PdfReader(source)
+
+
+# === Content hash of a PDF source, used to skip PDFs that are already ingested ===
+def file_sha256(source, block_size=1 << 20):
+    digest = hashlib.sha256()
+    if not isinstance(source, str):
+        digest.update(_buffer(source))
+        return digest.hexdigest()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# === Parse one page range of a PDF (runs in a worker process for pooled tasks) ===
+def _parse_pages(source, start, stop, key=None):
+    reader = _open_pdf(source)
+    key = key if key is not None else source
+    return [
+        Document(page_content=reader.pages[i].extract_text(), metadata={"source": key, "page": i})
+        for i in range(start, stop)
+    ]
+
+
+def _page_count(source):
+    return len(_open_pdf(source).pages)
+
+
+# === Shared process pool of INGEST_WORKERS processes, created once on first use ===
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the parent already has torch/tokenizer threads running
+            _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+# === Split each (key, source) into (source, start, stop, key) tasks, in document order ===
+def _plan_tasks(sources, pages_per_task):
+    tasks = []
+    for key, source in sources:
+        n_pages = _page_count(source)
+        for start in range(0, n_pages, pages_per_task):
+            tasks.append((source, start, min(start + pages_per_task, n_pages), key))
+    return tasks
+
+
+# === Write an in-memory PDF to a temp file so pool workers can open it by path ===
+def _spill(source):
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(_buffer(source))
+    return path
+
+
+# === Task arguments for a worker process: paths as-is, in-memory PDFs as bytes or a spilled file ===
+def _pool_tasks(tasks, spilled):
+    ranges = defaultdict(int)
+    for source, *_ in tasks:
+        ranges[id(source)] += 1
+    pool_tasks = []
+    for source, start, stop, key in tasks:
+        if not isinstance(source, str):
+            if ranges[id(source)] > 1:
+                # Split across workers: ship it once to disk instead of once per page range
+                if id(source) not in spilled:
+                    spilled[id(source)] = _spill(source)
+                source = spilled[id(source)]
+            else:
+                source = _buffer(source).tobytes()
+        pool_tasks.append((source, start, stop, key))
+    return pool_tasks
+
+
+# === Yield one Document per page, in document order, parsing ahead on the process pool ===
+# `sources` are file paths or (key, source) pairs; page metadata["source"] is the key.
+# In-memory sources are parsed from their buffer; any temp file spilled for the pool is deleted before this returns.
+# `on_total` is called with the total page count once the files have been opened
+def iter_pages(sources, max_workers=None, pages_per_task=PAGES_PER_TASK, on_total=None):
+    max_workers = max_workers or INGEST_WORKERS
+    sources = [(source, source) if isinstance(source, str) else source for source in sources]
+    tasks = _plan_tasks(sources, pages_per_task)
+    if on_total:
+        on_total(sum(stop - start for _, start, stop, _ in tasks))
+
+    # Not worth the IPC for a single small file
+    if max_workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield from _parse_pages(*task)
+        return
+
+    # Only a couple of tasks per worker are in flight, so parsed pages never pile up in memory;
+    # a smaller max_workers limits this call's share of the shared pool
+    executor = _get_executor()
+    spilled = {}
+    pending = deque()
+    try:
+        for task in _pool_tasks(tasks, spilled):
+            pending.append(executor.submit(_parse_pages, *task))
+            if len(pending) >= max_workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Stopped early (cancelled or failed): let in-flight workers finish with the files before removing them
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        for path in spilled.values():
+            os.remove(path)
@@ -0,0 +1,55 @@
+import os
+import threading
+from collections import OrderedDict
+
+RERANK_MODEL = os.environ.get("RAGBOT_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = 32
+# (query, chunk id) scores remembered; chunk ids change whenever chunk text changes
+SCORE_CACHE_SIZE = 4096
+
+_rerankers = {}
+_registry_lock = threading.Lock()
+
+
+# === Small CPU cross-encoder scoring (query, chunk) pairs, with a score cache ===
+class Reranker:
+    def __init__(self, model_name):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def scores(self, query, ids, texts):
+        with self._lock:
+            cached = {}
+            for chunk_id in ids:
+                if (query, chunk_id) in self._scores:
+                    self._scores.move_to_end((query, chunk_id))
+                    cached[chunk_id] = self._scores[(query, chunk_id)]
+
+            missing = [(chunk_id, text) for chunk_id, text in zip(ids, texts) if chunk_id not in cached]
+            if missing:
+                predicted = self.model.predict(
+                    [(query, text) for _, text in missing], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False
+                )
+                for (chunk_id, _), score in zip(missing, predicted):
+                    cached[chunk_id] = float(score)
+                    self._scores[(query, chunk_id)] = float(score)
+                while len(self._scores) > SCORE_CACHE_SIZE:
+                    self._scores.popitem(last=False)
+        return [cached[chunk_id] for chunk_id in ids]
+
+    # === Best `top_n` of the candidate ids, highest score first ===
+    def rerank(self, query, ids, texts, top_n):
+        scores = self.scores(query, ids, texts)
+        order = sorted(range(len(ids)), key=lambda i: scores[i], reverse=True)
+        return [ids[i] for i in order[:top_n]]
+
+
+def get_reranker(model_name=RERANK_MODEL):
+    with _registry_lock:
+        if model_name not in _rerankers:
+            _rerankers[model_name] = Reranker(model_name)
+        return _rerankers[model_name]
@@ -0,0 +1,78 @@
+import os
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from modules.lexical_index import get_lexical_index
+from modules.reranker import get_reranker
+
+# Candidates taken from each of the vector and BM25 rankings before fusion
+FETCH_K = 10
+# Reciprocal-rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+# "hybrid" (fused vector + BM25) or "rerank" (wide hybrid candidate set narrowed by a cross-encoder)
+RETRIEVAL_MODE = os.environ.get("RAGBOT_RETRIEVAL_MODE", "hybrid")
+RERANK_CANDIDATES = 30
+
+
+# === Reciprocal-rank fusion of several ranked id lists ===
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# === Vector (Chroma) + lexical (BM25) retrieval, fused by rank ===
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any
+    index: Any
+    k: int = 3
+    fetch_k: int = FETCH_K
+    # When set, this many fused candidates are reranked by `reranker` and the best k kept
+    rerank_candidates: int = 0
+    reranker: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        collection = self.vectorstore._collection
+        fetch_k = max(self.fetch_k, self.rerank_candidates)
+        vector_hits = collection.query(
+            query_embeddings=[self.vectorstore._embedding_function.embed_query(query)],
+            n_results=fetch_k,
+            include=["documents", "metadatas"],
+        )
+        docs = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(
+                vector_hits["ids"][0], vector_hits["documents"][0], vector_hits["metadatas"][0]
+            )
+        }
+        lexical_ids = [chunk_id for chunk_id, _ in self.index.search(query, fetch_k)]
+
+        fused = reciprocal_rank_fusion([vector_hits["ids"][0], lexical_ids])
+        fused = fused[:self.rerank_candidates] if self.reranker else fused[:self.k]
+
+        # Keyword-only hits still need their text and metadata
+        missing = [chunk_id for chunk_id in fused if chunk_id not in docs]
+        if missing:
+            extra = collection.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+                docs[chunk_id] = Document(page_content=text, metadata=metadata or {})
+        fused = [chunk_id for chunk_id in fused if chunk_id in docs]
+
+        if self.reranker:
+            fused = self.reranker.rerank(query, fused, [docs[chunk_id].page_content for chunk_id in fused], self.k)
+        return [docs[chunk_id] for chunk_id in fused]
+
+
+def get_retriever(vectorstore, k=3, mode=None):
+    mode = mode or RETRIEVAL_MODE
+    if mode == "rerank":
+        rerank = {"rerank_candidates": RERANK_CANDIDATES, "reranker": get_reranker()}
+    elif mode == "hybrid":
+        rerank = {}
+    else:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected 'hybrid' or 'rerank'")
+    return HybridRetriever(vectorstore=vectorstore, index=get_lexical_index(vectorstore), k=k, **rerank)
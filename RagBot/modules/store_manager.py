@@ -0,0 +1,165 @@
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain_community.vectorstores import Chroma
+
+from modules.embeddings import DEFAULT_MODEL, get_embeddings, model_key
+from modules.lexical_index import close_lexical_index
+
+logger = logging.getLogger(__name__)
+
+PERSIST_DIR = "./chroma_store"
+# Open Chroma clients kept in memory; the least recently used one is closed past this
+MAX_OPEN_STORES = int(os.environ.get("RAGBOT_MAX_OPEN_STORES", 16))
+# Stores nobody touched for this long are closed on the next lookup
+STORE_IDLE_SECONDS = int(os.environ.get("RAGBOT_STORE_IDLE_SECONDS", 30 * 60))
+
+# HNSW segment files chromadb reads when a collection is first queried
+SEGMENT_FILES = ("header.bin", "data_level0.bin", "length.bin", "link_lists.bin")
+
+_open_stores = OrderedDict()  # user_id -> {"store", "last_used", "users"}, least recently used first
+_lock = threading.Lock()
+
+
+def _safe_name(value):
+    return re.sub(r"[^A-Za-z0-9_.@-]", "_", str(value))
+
+
+# === Each user gets their own directory under PERSIST_DIR, one per embedding backend ===
+# Vectors from different backends don't share a space, so switching RAGBOT_EMBEDDING_BACKEND opens (and
+# re-ingests into) a separate store instead of searching int8 query vectors against torch chunks.
+# The torch backend keeps the original unsuffixed directory.
+def user_store_dir(user_id):
+    name = _safe_name(user_id)
+    key = model_key()
+    if key != DEFAULT_MODEL:
+        name = f"{name}__{_safe_name(key)}"
+    return os.path.join(PERSIST_DIR, name)
+
+
+def _close_store(user_id, vectorstore):
+    # chromadb has no public close(); stop the client's system and drop it from chromadb's shared cache
+    try:
+        from chromadb.api.client import SharedSystemClient
+
+        client = vectorstore._client
+        SharedSystemClient._identifer_to_system.pop(client._identifier, None)
+        client._system.stop()
+    except Exception as e:
+        logger.warning("Could not close vector store for %s: %s", user_id, e)
+
+    # The sqlite files kept next to chromadb's: the BM25 index and the ingest manifest
+    from modules.vectorstore import close_manifest  # imported here: modules.vectorstore imports this module
+
+    close_lexical_index(vectorstore._persist_directory)
+    close_manifest(vectorstore._persist_directory)
+
+
+# === Close idle or least recently used stores; a store someone has acquired is never closed ===
+def _evict(now):
+    closed = []
+    unused = [user_id for user_id, entry in _open_stores.items() if not entry["users"]]
+    for user_id in unused:
+        entry = _open_stores[user_id]
+        if len(_open_stores) > MAX_OPEN_STORES or now - entry["last_used"] > STORE_IDLE_SECONDS:
+            del _open_stores[user_id]
+            closed.append((user_id, entry["store"]))
+    return closed
+
+
+def _lookup(user_id, acquire):
+    now = time.monotonic()
+    with _lock:
+        entry = _open_stores.pop(user_id, None)
+        if entry is None:
+            vectorstore = Chroma(persist_directory=user_store_dir(user_id), embedding_function=get_embeddings())
+            entry = {"store": vectorstore, "last_used": now, "users": 0}
+        entry["last_used"] = now
+        if acquire:
+            entry["users"] += 1
+        _open_stores[user_id] = entry
+        closed = _evict(now)
+    for closed_user, vectorstore in closed:
+        _close_store(closed_user, vectorstore)
+    return entry["store"]
+
+
+# === Open (lazily) or reuse the Chroma store of one user ===
+# The handle may be closed once it is idle; hold it with acquire_user_store()/user_store() while using it.
+def get_user_store(user_id):
+    return _lookup(user_id, acquire=False)
+
+
+def acquire_user_store(user_id):
+    return _lookup(user_id, acquire=True)
+
+
+def release_user_store(user_id):
+    with _lock:
+        entry = _open_stores.get(user_id)
+        if entry is not None and entry["users"]:
+            entry["users"] -= 1
+            entry["last_used"] = time.monotonic()
+
+
+# === The user's store, kept open for the duration of the with-block (an ingestion, a chat turn) ===
+@contextmanager
+def user_store(user_id):
+    vectorstore = acquire_user_store(user_id)
+    try:
+        yield vectorstore
+    finally:
+        release_user_store(user_id)
+
+
+# === Close a user's store now, unless it is in use; returns True if it was closed ===
+def close_user_store(user_id):
+    with _lock:
+        entry = _open_stores.get(user_id)
+        if entry is None or entry["users"]:
+            return False
+        del _open_stores[user_id]
+    _close_store(user_id, entry["store"])
+    return True
+
+
+def open_store_count():
+    return len(_open_stores)
+
+
+# === True if the user already has a persisted store on disk ===
+def has_user_store(user_id):
+    return os.path.exists(os.path.join(user_store_dir(user_id), "chroma.sqlite3"))
+
+
+# === Map the store's files and ask the kernel to read them ahead, so the first query hits page cache ===
+def _prefetch_segments(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name not in SEGMENT_FILES and name != "chroma.sqlite3":
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        if hasattr(mapped, "madvise"):
+                            mapped.madvise(mmap.MADV_WILLNEED)
+            except OSError as e:
+                logger.debug("Could not prefetch %s: %s", path, e)
+
+
+# === Attach a user's existing store at login without ingesting anything ===
+def attach_user_store(user_id):
+    if not has_user_store(user_id):
+        return None
+    if user_id not in _open_stores:
+        _prefetch_segments(user_store_dir(user_id))
+    return get_user_store(user_id)
@@ -1,37 +1,119 @@
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from modules.pdf_handler import save_uploaded_files
 import os
+import sqlite3
+import threading
+from datetime import datetime
 
-PERSIST_DIR = "./chroma_store"
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from modules.pdf_handler import iter_pages, file_sha256
+from modules.embedding_cache import get_cached_embeddings
+from modules.ingest import ingest_pages, IngestMetrics
+from modules.store_manager import user_store
+from modules.answer_cache import invalidate_answers
+from modules.lexical_index import get_lexical_index
 
-def load_vectorstore(uploaded_files,user_id):
-    paths = save_uploaded_files(uploaded_files)
+_manifests = {}
+_manifests_lock = threading.Lock()
 
-    docs = []
-    for path in paths:
-        loader = PyPDFLoader(path)
-        docs.extend(loader.load())
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    texts = splitter.split_documents(docs)
-
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L12-v2")
-
-    if os.path.exists(PERSIST_DIR) and os.listdir(PERSIST_DIR):
-        # Append to existing
-        vectorstore = Chroma(persist_directory=PERSIST_DIR, embedding_function=embeddings)
-        vectorstore.add_documents(texts)
-        vectorstore.persist()
-    else:
-        # Create new
-        vectorstore = Chroma.from_documents(
-            documents=texts,
-            embedding=embeddings,
-            persist_directory=PERSIST_DIR
+# === The content hash each file name currently has in a store; a cancelled or failed file is never recorded ===
+# One row per file name: re-uploading an earlier version of a file (v1, v2, v1) re-ingests it.
+def _manifest(vectorstore):
+    directory = vectorstore._persist_directory
+    with _manifests_lock:
+        if directory not in _manifests:
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(directory, "files.sqlite"), check_same_thread=False)
+            # Superseded layout that kept every hash ever ingested
+            db.execute("DROP TABLE IF EXISTS ingested_files")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS current_files (file_name TEXT PRIMARY KEY, file_hash TEXT, ingested_at TEXT)"
+            )
+            db.commit()
+            _manifests[directory] = (db, threading.Lock())
+        return _manifests[directory]
+
+
+# === True if the store's current version of this file has exactly this content ===
+def _is_ingested(vectorstore, file_name, file_hash):
+    db, lock = _manifest(vectorstore)
+    with lock:
+        row = db.execute("SELECT 1 FROM current_files WHERE file_name = ? AND file_hash = ?", (file_name, file_hash))
+        return row.fetchone() is not None
+
+
+def _record_ingested(vectorstore, files):
+    db, lock = _manifest(vectorstore)
+    with lock:
+        db.executemany(
+            "INSERT OR REPLACE INTO current_files (file_name, file_hash, ingested_at) VALUES (?, ?, ?)",
+            [(f["file_name"], f["file_hash"], datetime.utcnow().isoformat()) for f in files],
         )
-        vectorstore.persist()
+        db.commit()
+
+
+# === Close the manifest of a store that is being closed; the next _manifest reopens it ===
+def close_manifest(directory):
+    with _manifests_lock:
+        manifest = _manifests.pop(directory, None)
+    if manifest is not None:
+        db, lock = manifest
+        with lock:
+            db.close()
+
+
+# === Attach the uploaded file's name and content hash to each of its pages ===
+def _tag_pages(pages, files):
+    for page in pages:
+        page.metadata.update(files[page.metadata["source"]])
+        yield page
+
+
+# === Ingest PDFs, given as (source, file name) pairs, into the user's store ===
+# A source is a saved file's path or the uploaded file itself, which is parsed from memory.
+# `cancel` is an optional threading.Event; setting it stops ingestion with IngestCancelled.
+# `progress` is called with IngestMetrics.as_dict() (pages, chunks, vectors, per-stage seconds) as work advances.
+def ingest_files(files, user_id, max_workers=None, cancel=None, progress=None):
+    metrics = IngestMetrics(progress)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+
+    # The user's own store (created on first upload), held open for the whole run; chunks are streamed in batches
+    with user_store(user_id) as vectorstore:
+        # Re-submitted PDFs with identical bytes are skipped without being parsed; keyed by hash so
+        # in-memory uploads that share a name don't collide
+        pending, sources = {}, []
+        for source, file_name in files:
+            file_hash = file_sha256(source)
+            if file_hash not in pending and not _is_ingested(vectorstore, file_name, file_hash):
+                # Stored as the chunk's "source": the path for saved files, the name for in-memory uploads
+                label = source if isinstance(source, str) else file_name
+                pending[file_hash] = {"source": label, "file_name": file_name, "file_hash": file_hash}
+                sources.append((file_hash, source))
+
+        if pending:
+            def set_total(pages_total):
+                metrics.pages_total = pages_total
+
+            parsed = iter_pages(sources, max_workers=max_workers, on_total=set_total)
+            try:
+                # Chunk vectors come from the on-disk cache when the same text was embedded before
+                ingest_pages(
+                    _tag_pages(parsed, pending), vectorstore, get_cached_embeddings(), splitter,
+                    index=get_lexical_index(vectorstore), cancel=cancel, metrics=metrics,
+                )
+            finally:
+                # Removes any temp file the parser spilled, even when ingestion stopped part-way
+                parsed.close()
+                # Answers cached against the old documents may now be wrong, even after a partial run
+                invalidate_answers(user_id)
+            vectorstore.persist()
+            _record_ingested(vectorstore, pending.values())
+        else:
+            metrics.finish()
 
     return vectorstore
+
+
+# === Ingest Streamlit uploads straight from their in-memory buffers (nothing is written to /tmp) ===
+def load_vectorstore(uploaded_files,user_id, max_workers=None, progress=None):
+    files = [(file, file.name) for file in uploaded_files]
+    return ingest_files(files, user_id, max_workers, progress=progress)
@@ -0,0 +1,166 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# Buffered writes are sent at least this often...
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("RAGBOT_WRITE_FLUSH_SECONDS", 1.0))
+# ...or as soon as this many are waiting
+MAX_BATCH = int(os.environ.get("RAGBOT_WRITE_BATCH", 500))
+# Connection errors are retried with exponential backoff this many times before the batch is dropped
+MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8
+# How long shutdown waits for the last batch
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+
+# === Buffers pymongo write operations and sends them with bulk_write from a background thread ===
+# Operations must be safe to send twice (upserts keyed on _id, $set): a batch that hit a connection error is resent.
+# An operation the server rejects (validation, document too large, ...) is logged and dropped; it never blocks the rest.
+class WriteBehind:
+    def __init__(self, flush_interval=FLUSH_INTERVAL_SECONDS, max_batch=MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._ops = deque()  # (collection, operation, key), in submission order
+        self._in_flight = []
+        self._pending_keys = Counter()  # key -> operations queued or in flight
+        self._flush_requested = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="write-behind")
+            self._thread.start()
+            atexit.register(self.flush, SHUTDOWN_TIMEOUT_SECONDS)
+
+    # `key` (e.g. a user id) lets callers wait for just their own writes with flush(key=...)
+    def submit(self, collection, operation, key=None):
+        with self._cond:
+            self._start()
+            self._ops.append((collection, operation, key))
+            self._pending_keys[key] += 1
+            if len(self._ops) >= self.max_batch:
+                self._cond.notify_all()
+
+    def _pending(self, key):
+        if key is None:
+            return len(self._ops) + len(self._in_flight)
+        return self._pending_keys[key]
+
+    # === Block until the writes submitted so far (only `key`'s, if given) are sent or dropped ===
+    # Returns False if the timeout passed first; returns at once when there is nothing to wait for.
+    def flush(self, timeout=None, key=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._pending(key):
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending(key):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def pending(self):
+        with self._cond:
+            return self._pending(None)
+
+    def _take_batch(self):
+        with self._cond:
+            if not self._ops or not (self._flush_requested or len(self._ops) >= self.max_batch):
+                self._cond.wait(self.flush_interval)
+            self._in_flight = [self._ops.popleft() for _ in range(min(len(self._ops), self.max_batch))]
+            if not self._ops:
+                self._flush_requested = False
+            return self._in_flight
+
+    # === Send one collection's operations; returns how many were written ===
+    def _write_group(self, collection, operations):
+        written, attempt = 0, 0
+        while operations:
+            try:
+                collection.bulk_write(operations, ordered=True)
+                return written + len(operations)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors")
+                if not errors:
+                    # Only the write concern failed: the writes were applied, sending them again is harmless
+                    error = e
+                else:
+                    # Ordered: everything before the failed operation is written, everything after was not tried
+                    failed = errors[0]["index"]
+                    logger.error("Dropping write rejected by MongoDB on %s: %s", collection.name, errors[0].get("errmsg"))
+                    with self._cond:
+                        self.dropped += 1
+                    written += failed
+                    operations = operations[failed + 1:]
+                    continue
+            except AutoReconnect as e:  # includes NetworkTimeout and server selection timeouts
+                error = e
+            except Exception:
+                logger.exception("Dropping %d writes to %s", len(operations), collection.name)
+                with self._cond:
+                    self.dropped += len(operations)
+                return written
+
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                logger.error("Dropping %d writes to %s after %d retries: %s",
+                             len(operations), collection.name, MAX_RETRIES, error)
+                with self._cond:
+                    self.dropped += len(operations)
+                return written
+            with self._cond:
+                self.retries += 1
+            time.sleep(min(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), MAX_BACKOFF_SECONDS))
+        return written
+
+    def _write(self, batch):
+        # One bulk_write per run of consecutive operations on the same collection, keeping their order
+        groups = []
+        for collection, operation, _ in batch:
+            if groups and groups[-1][0] is collection:
+                groups[-1][1].append(operation)
+            else:
+                groups.append((collection, [operation]))
+        return sum(self._write_group(collection, operations) for collection, operations in groups)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            written = self._write(batch)
+            with self._cond:
+                self.written += written
+                self.batches += 1
+                for _, _, key in batch:
+                    self._pending_keys[key] -= 1
+                    if not self._pending_keys[key]:
+                        del self._pending_keys[key]
+                self._in_flight = []
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": self._pending(None),
+                "written": self.written,
+                "batches": self.batches,
+                "retries": self.retries,
+                "dropped": self.dropped,
+            }
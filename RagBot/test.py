@@ -171,9 +171,11 @@ if ("authentication_status" not in st.session_state or not st.session_state["aut
     st.stop()
 
 # --- Main App ---
-from modules.chat import display_chat_history, handle_user_input, download_chat_history
+from modules.chat import display_chat_history, handle_user_input
+from modules.export import download_chat_history, show_chat_export
 from modules.pdf_handler import upload_pdfs
 from modules.vectorstore import load_vectorstore
+from modules.store_manager import user_store
 from modules.llm import get_llm_chain
 from modules.chroma_inspector import inspect_chroma
 
@@ -195,14 +197,20 @@ st.write(f"Hello, **{st.session_state.get('name', 'User')}**! Let's work with yo
 uploaded_files, submitted = upload_pdfs()
 if submitted and uploaded_files:
     with st.spinner("Crunching your documents..."):
-        vectorstore = load_vectorstore(uploaded_files)
+        user_id = st.session_state.get("user", {}).get("email", "default_user")
+        vectorstore = load_vectorstore(uploaded_files, user_id)
         st.session_state.vectorstore = vectorstore
     st.success("Vector database updated! 🎉")
 
 if "vectorstore" in st.session_state:
-    inspect_chroma(st.session_state.vectorstore)
-    display_chat_history()
-    handle_user_input(get_llm_chain(st.session_state.vectorstore))
+    # Re-fetched each run in case the idle handle was closed, and held for the whole turn
+    with user_store(st.session_state.get("user", {}).get("email", "default_user")) as vectorstore:
+        st.session_state.vectorstore = vectorstore
+        inspect_chroma(vectorstore)
+        display_chat_history()
+        handle_user_input(get_llm_chain(vectorstore))
 
 if "vectorstore" in st.session_state and st.button("📥 Download Chat History"):
     download_chat_history()
+if "vectorstore" in st.session_state:
+    show_chat_export()